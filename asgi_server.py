@@ -0,0 +1,598 @@
+import asyncio
+import json
+import re
+from contextlib import asynccontextmanager
+from urllib.parse import parse_qsl
+
+import mysql.connector
+from werkzeug.datastructures import MultiDict
+from db import AsyncConnectionPool
+from server import (
+  RENTAL_STATS_DECREMENT_CUSTOMER_SQL, RENTAL_STATS_INCREMENT_SQL, STREAM_FORMATS,
+  app as flask_app, convert_data, customers_max_page_size, customers_page_size,
+  db_config, decode_cursor, encode_cursor, max_concurrent_streams, pool_config,
+  start_warmup, stream_chunk_size, stream_max_rows, stream_query_budget, warmup_state
+)
+
+# asyncio edition of server.py for ASGI servers, e.g.
+#   uvicorn asgi_server:app
+# /top_rented_films, /search and /search/suggest work from server.py's
+# in-process film catalog and indexes, so they run server.py's own views
+# on a worker thread rather than being written twice.
+
+pool = AsyncConnectionPool(
+  db_config,
+  pool_size=pool_config["pool_size"] + pool_config["max_overflow"],
+  pool_timeout=pool_config["pool_timeout"]
+)
+
+routes = []
+
+class Request:
+  def __init__(self, scope, body):
+    self.method = scope["method"]
+    self.path = scope["path"]
+    self.query_string = scope["query_string"].decode("latin-1")
+    self.args = MultiDict(parse_qsl(self.query_string))
+    self.headers = [(name.decode("latin-1"), value.decode("latin-1")) for name, value in scope["headers"]]
+    self.body = body
+
+  def get_json(self):
+    if not self.body:
+      return None
+    return json.loads(self.body)
+
+def route(path, methods):
+  pattern = re.sub(r"<int:(\w+)>", r"(?P<\1>\\d+)", path)
+  def decorator(handler):
+    routes.append((re.compile(f"^{pattern}$"), methods, handler))
+    return handler
+  return decorator
+
+def jsonify(data, status=200, headers=()):
+  # Same encoder Flask's jsonify uses, so both editions agree on shapes.
+  body = flask_app.json.dumps(data, separators=(",", ":")).encode() + b"\n"
+  return status, body, [("Content-Type", "application/json"), *headers]
+
+def stream_format(request):
+  stream = request.args.get('stream')
+  return stream if stream in STREAM_FORMATS else None
+
+stream_slots = asyncio.Semaphore(max_concurrent_streams)
+
+class StreamedBody:
+  # Encoded chunks of a streamed response. It holds one of stream_slots
+  # from creation until aclose(), which app() calls whether or not the
+  # body was sent.
+  def __init__(self, chunks):
+    self.chunks = chunks
+
+  def __aiter__(self):
+    return self.chunks
+
+  async def aclose(self):
+    if self.chunks is None:
+      return
+    chunks, self.chunks = self.chunks, None
+    try:
+      await chunks.aclose()
+    finally:
+      stream_slots.release()
+
+async def stream_rows(stream, rows):
+  # Response whose body is an async iterator of encoded chunks, one JSON
+  # array or NDJSON, like server.stream_rows, with the same limits on
+  # concurrent streams and on time. On failure NDJSON ends with an error
+  # line and the exception aborts the body before it completes.
+  if stream_slots.locked():
+    return jsonify({"error": "Too many streamed responses, try again later"}, 503)
+  await stream_slots.acquire()
+  dumps = flask_app.json.dumps
+  deadline = asyncio.get_running_loop().time() + stream_query_budget / 1000
+  async def encode():
+    if stream == "ndjson":
+      async for chunk in rows:
+        yield "".join(dumps(row) + "\n" for row in chunk).encode()
+      return
+    separator = "["
+    async for chunk in rows:
+      yield (separator + ",".join(dumps(row) for row in chunk)).encode()
+      separator = ","
+    yield b"[]" if separator == "[" else b"]"
+  async def generate():
+    try:
+      async for chunk in encode():
+        yield chunk
+        if asyncio.get_running_loop().time() > deadline:
+          raise TimeoutError("Streamed response exceeded its time budget")
+    except Exception as err:
+      if stream == "ndjson":
+        message = "Query exceeded its time budget" if isinstance(err, TimeoutError) else "Response failed"
+        yield (dumps({"error": message}) + "\n").encode()
+      raise
+  return 200, StreamedBody(generate()), [("Content-Type", STREAM_FORMATS[stream])]
+
+async def query_chunks(query, params):
+  # fetchmany() batches of a query's rows. The connection is held until
+  # the last row is sent; rows left by a client that goes away are
+  # drained before it goes back to the pool.
+  async with connection() as conn:
+    cursor = await conn.cursor(dictionary=True)
+    await cursor.execute(query, params)
+    try:
+      while True:
+        rows = await cursor.fetchmany(stream_chunk_size)
+        if not rows:
+          return
+        yield rows
+    except GeneratorExit:
+      while await cursor.fetchmany(stream_chunk_size):
+        pass
+      raise
+
+def run_wsgi_view(request):
+  # Whole Flask request: caching, ETags, primary pinning and teardown all
+  # apply. The body is buffered, streamed or not.
+  client = flask_app.test_client(use_cookies=False)
+  response = client.open(request.path, method=request.method, query_string=request.query_string,
+                         headers=request.headers, data=request.body)
+  headers = [(name, value) for name, value in response.headers if name.lower() != "content-length"]
+  return response.status_code, response.get_data(), headers
+
+@asynccontextmanager
+async def connection():
+  conn = await pool.get_connection()
+  try:
+    yield conn
+  finally:
+    await pool.release(conn)
+
+@route('/ready', ['GET'])
+async def get_ready(request):
+  # The views run from server.py need its catalog, indexes and pool, so
+  # readiness is server.py's warmup, started at lifespan startup or here.
+  start_warmup()
+  return jsonify(warmup_state, 200 if warmup_state["ready"] else 503)
+
+@route('/health', ['GET'])
+async def get_health(request):
+  try:
+    state = await pool.ping()
+  except mysql.connector.Error as err:
+    return jsonify({"status": "unavailable", "error": str(err)}, 503)
+  return jsonify({"status": "ok", "pool": state})
+
+@route('/metrics', ['GET'])
+async def get_metrics(request):
+  return jsonify({"pool": pool.stats()})
+
+@route('/top_rented_films', ['GET'])
+async def get_top_rented_films(request):
+  # Rows come from server.py's film catalog, language and categories named
+  return await asyncio.to_thread(run_wsgi_view, request)
+
+@route('/film_inventory/<int:film_id>', ['GET'])
+async def get_film_inventory(request, film_id):
+  available_query = """
+    SELECT COUNT(*) AS available_inventory
+    FROM inventory
+    WHERE film_id = %s
+      AND inventory_id NOT IN (
+          SELECT inventory_id FROM rental WHERE return_date IS NULL
+      )
+  """
+  async with connection() as conn:
+    cursor = await conn.cursor(dictionary=True)
+    await cursor.execute("SELECT COUNT(*) AS total_inventory FROM inventory WHERE film_id = %s", (film_id,))
+    total = await cursor.fetchone()
+    await cursor.execute(available_query, (film_id,))
+    available = await cursor.fetchone()
+  return jsonify({
+    "total_inventory": total["total_inventory"],
+    "available_inventory": available["available_inventory"]
+  })
+
+@route('/return_film', ['POST'])
+async def return_film(request):
+  data = request.get_json()
+  rental_id_input = data.get('rental_id')
+  customer_id = data.get('customer_id')
+  film_id = data.get('film_id')
+
+  rental_id = rental_id_input if rental_id_input and str(rental_id_input).strip() not in ["", "0"] else None
+
+  if rental_id is None and (customer_id is None or str(customer_id).strip() == ""):
+    return jsonify({"error": "Missing rental_id or customer_id"}, 400)
+
+  customer_str = str(customer_id).strip() if customer_id is not None else ""
+
+  async with connection() as conn:
+    cursor = await conn.cursor()
+
+    if rental_id:
+      update_query = """
+        UPDATE rental
+        SET return_date = NOW()
+        WHERE rental_id = %s AND return_date IS NULL
+      """
+      await cursor.execute(update_query, (rental_id,))
+      await conn.commit()
+      if cursor.rowcount == 0:
+        return jsonify({"error": "Rental not found or already returned"}, 400)
+      return jsonify({"message": "Film returned successfully", "rental_id": rental_id})
+
+    elif customer_str == "0":
+      update_query = """
+        UPDATE rental
+        SET return_date = NOW()
+        WHERE return_date IS NULL
+      """
+      await cursor.execute(update_query)
+      await conn.commit()
+      return jsonify({
+        "message": "All films returned successfully",
+        "returned_count": cursor.rowcount
+      })
+
+    customer_id_val = int(customer_id)
+    if film_id:
+      select_query = """
+        SELECT r.rental_id
+        FROM rental r
+        JOIN inventory i ON r.inventory_id = i.inventory_id
+        WHERE r.customer_id = %s AND i.film_id = %s AND r.return_date IS NULL
+        ORDER BY r.rental_date ASC
+        LIMIT 1
+      """
+      await cursor.execute(select_query, (customer_id_val, int(film_id)))
+    else:
+      select_query = """
+        SELECT rental_id
+        FROM rental
+        WHERE customer_id = %s AND return_date IS NULL
+        ORDER BY rental_date ASC
+        LIMIT 1
+      """
+      await cursor.execute(select_query, (customer_id_val,))
+
+    result = await cursor.fetchall()
+    if not result:
+      return jsonify({"error": "No active rental found for the provided customer/film"}, 400)
+
+    rental_id = result[0][0]
+    update_query = """
+      UPDATE rental
+      SET return_date = NOW()
+      WHERE rental_id = %s
+    """
+    await cursor.execute(update_query, (rental_id,))
+    await conn.commit()
+  return jsonify({"message": "Film returned successfully", "rental_id": rental_id})
+
+@route('/top_actors', ['GET'])
+async def get_top_actors(request):
+  query = """
+    SELECT
+      a.actor_id,
+      CONCAT(a.first_name, ' ', a.last_name) AS actor_name,
+      COUNT(fa.film_id) AS film_count
+    FROM actor a
+    JOIN film_actor fa ON a.actor_id = fa.actor_id
+    JOIN inventory i ON fa.film_id = i.film_id
+    GROUP BY a.actor_id
+    ORDER BY film_count DESC
+    LIMIT 5;
+  """
+  async with connection() as conn:
+    cursor = await conn.cursor(dictionary=True)
+    await cursor.execute(query)
+    actors = await cursor.fetchall()
+  return jsonify(actors)
+
+@route('/actor_films/<int:actor_id>', ['GET'])
+async def get_actor_top_films(request, actor_id):
+  query = """
+    SELECT
+      f.film_id, f.title, s.rental_count
+    FROM film_actor fa
+    JOIN film_rental_stats s ON fa.film_id = s.film_id
+    JOIN film f ON fa.film_id = f.film_id
+    WHERE fa.actor_id = %s AND s.rental_count > 0
+    ORDER BY s.rental_count DESC
+    LIMIT 5;
+  """
+  async with connection() as conn:
+    cursor = await conn.cursor(dictionary=True)
+    await cursor.execute(query, (actor_id,))
+    films = await cursor.fetchall()
+  return jsonify(films)
+
+@route('/search', ['GET'])
+async def search_films(request):
+  return await asyncio.to_thread(run_wsgi_view, request)
+
+@route('/search/suggest', ['GET'])
+async def search_suggest(request):
+  return await asyncio.to_thread(run_wsgi_view, request)
+
+@route('/rent_film', ['POST'])
+async def rent_film(request):
+  data = request.get_json()
+  film_id = data.get('film_id')
+  customer_id = data.get('customer_id')
+  if not film_id or not customer_id:
+    return jsonify({"error": "Missing film_id or customer_id"}, 400)
+  query = """
+    SELECT inventory_id
+    FROM inventory
+    WHERE film_id = %s
+      AND inventory_id NOT IN (
+          SELECT inventory_id FROM rental WHERE return_date IS NULL
+      )
+    LIMIT 1;
+  """
+  insert_query = """
+    INSERT INTO rental (rental_date, inventory_id, customer_id, staff_id)
+    VALUES (NOW(), %s, %s, 1)
+  """
+  async with connection() as conn:
+    cursor = await conn.cursor()
+    await cursor.execute(query, (film_id,))
+    result = await cursor.fetchall()
+    if not result:
+      return jsonify({"error": "Film not available for rent"}, 400)
+    await cursor.execute(insert_query, (result[0][0], customer_id))
+    rental_id = cursor.lastrowid
+    await cursor.execute(RENTAL_STATS_INCREMENT_SQL, (film_id,))
+    await conn.commit()
+  return jsonify({"message": "Film rented successfully", "rental_id": rental_id})
+
+@route('/customers', ['GET'])
+async def get_customers(request):
+  # Keyset pages as in server.py: customer_id, last_name or create_date
+  # order with customer_id breaking ties, next page in X-Next-Cursor.
+  sort = request.args.get('sort', 'customer_id')
+  if sort not in ("customer_id", "last_name", "create_date"):
+    return jsonify({"error": "sort must be customer_id, last_name or create_date"}, 400)
+  stream = stream_format(request)
+  if stream is not None:
+    limit = min(max(request.args.get('limit', stream_max_rows, type=int), 1), stream_max_rows)
+  else:
+    limit = min(max(request.args.get('limit', customers_page_size, type=int), 1), customers_max_page_size)
+  try:
+    if sort == "customer_id":
+      after = decode_cursor(request.args.get('cursor'), int)
+      if after is None and request.args.get('after_id') is not None:
+        after = [int(request.args['after_id'])]
+    else:
+      after = decode_cursor(request.args.get('cursor'), str, int)
+  except ValueError:
+    return jsonify({"error": "Invalid cursor"}, 400)
+
+  conditions = []
+  params = []
+  if request.args.get('store_id') is not None:
+    store_id = request.args.get('store_id', type=int)
+    async with connection() as conn:
+      cursor = await conn.cursor()
+      await cursor.execute("SELECT store_id FROM store WHERE store_id = %s", (store_id,))
+      if not await cursor.fetchall():
+        return jsonify({"error": "Unknown store_id"}, 400)
+    conditions.append("store_id = %s")
+    params.append(store_id)
+  if request.args.get('active') is not None:
+    active = request.args.get('active', type=int)
+    if active not in (0, 1):
+      return jsonify({"error": "active must be 0 or 1"}, 400)
+    conditions.append("active = %s")
+    params.append(active)
+  if after is not None and sort == "customer_id":
+    conditions.append("customer_id > %s")
+    params.append(after[0])
+  elif after is not None:
+    conditions.append(f"({sort} > %s OR ({sort} = %s AND customer_id > %s))")
+    params += [after[0], after[0], after[1]]
+
+  query = """
+  SELECT customer_id, store_id, first_name, last_name, email, address_id, active, create_date
+  FROM customer
+  """
+  if conditions:
+    query += " WHERE " + " AND ".join(conditions)
+  order = "customer_id" if sort == "customer_id" else f"{sort}, customer_id"
+  query += f" ORDER BY {order}"
+  query += " LIMIT %s"
+  # A page reads one past limit to learn whether a next page exists
+  params.append(limit if stream is not None else limit + 1)
+
+  if stream is not None:
+    return await stream_rows(stream, query_chunks(query, params))
+
+  async with connection() as conn:
+    cursor = await conn.cursor(dictionary=True)
+    await cursor.execute(query, params)
+    customers = await cursor.fetchall()
+
+  headers = []
+  if len(customers) > limit:
+    customers = customers[:limit]
+    last = customers[-1]
+    if sort == "customer_id":
+      next_cursor = encode_cursor(last["customer_id"])
+    else:
+      next_cursor = encode_cursor(convert_data(last[sort]), last["customer_id"])
+    headers.append(("X-Next-Cursor", next_cursor))
+  return jsonify(customers, headers=headers)
+
+@route('/customers/search', ['GET'])
+async def search_customers(request):
+  search_type = request.args.get('type')
+  query_param = request.args.get('query')
+
+  if not search_type or not query_param:
+    return jsonify([])
+
+  if search_type == "customer_id":
+    sql = "SELECT customer_id, first_name, last_name, email FROM customer WHERE customer_id = %s"
+    params = (query_param,)
+  elif search_type == "first_name":
+    sql = "SELECT customer_id, first_name, last_name, email FROM customer WHERE first_name LIKE %s"
+    params = ('%' + query_param + '%',)
+  elif search_type == "last_name":
+    sql = "SELECT customer_id, first_name, last_name, email FROM customer WHERE last_name LIKE %s"
+    params = ('%' + query_param + '%',)
+  else:
+    return jsonify([])
+
+  async with connection() as conn:
+    cursor = await conn.cursor(dictionary=True)
+    await cursor.execute(sql, params)
+    customers = await cursor.fetchall()
+  return jsonify(customers)
+
+@route('/customers/add', ['POST'])
+async def add_customer(request):
+  data = request.get_json()
+  first_name = data.get('first_name')
+  last_name = data.get('last_name')
+  email = data.get('email')
+  store_id = data.get('store_id')
+  address_id = data.get('address_id')
+
+  if not first_name or not last_name or not email or not store_id or not address_id:
+    return jsonify({"error": "Missing required fields"}, 400)
+
+  insert_query = """
+  INSERT INTO customer (store_id, first_name, last_name, email, address_id, create_date)
+  VALUES (%s, %s, %s, %s, %s, NOW())
+  """
+  async with connection() as conn:
+    cursor = await conn.cursor(dictionary=True)
+    await cursor.execute(insert_query, (store_id, first_name, last_name, email, address_id))
+    await conn.commit()
+    new_customer_id = cursor.lastrowid
+    await cursor.execute("SELECT customer_id, store_id, first_name, last_name, email, address_id FROM customer WHERE customer_id = %s", (new_customer_id,))
+    new_customer = await cursor.fetchone()
+  return jsonify(new_customer)
+
+@route('/edit_customer/<int:customer_id>', ['PUT'])
+async def edit_customer(request, customer_id):
+  data = request.get_json()
+
+  required_fields = ["store_id", "first_name", "last_name", "email", "address_id", "active"]
+  for field in required_fields:
+    if field not in data:
+      return jsonify({"error": f"Missing field: {field}"}, 400)
+
+  query = """
+  UPDATE customer
+  SET store_id = %s, first_name = %s, last_name = %s, email = %s, address_id = %s, active = %s
+  WHERE customer_id = %s
+  """
+  async with connection() as conn:
+    try:
+      cursor = await conn.cursor()
+      await cursor.execute(query, (
+        data["store_id"], data["first_name"], data["last_name"], data["email"],
+        data["address_id"], data["active"], customer_id
+      ))
+      await conn.commit()
+    except mysql.connector.Error as err:
+      await conn.rollback()
+      return jsonify({"error": str(err)}, 500)
+  return jsonify({"message": "Customer updated successfully"})
+
+@route('/delete_customer/<int:customer_id>', ['DELETE'])
+async def delete_customer(request, customer_id):
+  async with connection() as conn:
+    try:
+      cursor = await conn.cursor()
+      await cursor.execute("DELETE FROM payment WHERE customer_id = %s", (customer_id,))
+      await cursor.execute(RENTAL_STATS_DECREMENT_CUSTOMER_SQL, (customer_id,))
+      await cursor.execute("DELETE FROM rental WHERE customer_id = %s", (customer_id,))
+      await cursor.execute("DELETE FROM customer WHERE customer_id = %s", (customer_id,))
+      await conn.commit()
+    except mysql.connector.Error as err:
+      await conn.rollback()
+      print(f"Error deleting customer: {str(err)}")
+      return jsonify({"error": f"Error deleting customer: {str(err)}"}, 500)
+  return jsonify({"message": "Customer deleted successfully"})
+
+@route('/customer/<int:customer_id>/rental_history', ['GET'])
+async def get_customer_rental_history(request, customer_id):
+  query = """
+  SELECT r.rental_id, f.title, r.rental_date, r.return_date
+  FROM rental r
+  JOIN inventory i ON r.inventory_id = i.inventory_id
+  JOIN film f ON i.film_id = f.film_id
+  WHERE r.customer_id = %s
+  ORDER BY r.rental_date DESC
+  """
+  stream = stream_format(request)
+  if stream is not None:
+    limit = min(max(request.args.get('limit', stream_max_rows, type=int), 1), stream_max_rows)
+    return await stream_rows(stream, query_chunks(query + " LIMIT %s", (customer_id, limit)))
+  async with connection() as conn:
+    cursor = await conn.cursor(dictionary=True)
+    await cursor.execute(query, (customer_id,))
+    rental_history = await cursor.fetchall()
+  return jsonify(rental_history)
+
+async def dispatch(request):
+  allowed = False
+  for pattern, methods, handler in routes:
+    match = pattern.match(request.path)
+    if match is None:
+      continue
+    if request.method not in methods and not (request.method == "HEAD" and "GET" in methods):
+      allowed = True
+      continue
+    kwargs = {name: int(value) for name, value in match.groupdict().items()}
+    try:
+      return await handler(request, **kwargs)
+    except mysql.connector.errors.PoolError:
+      return jsonify({"error": "Database busy, try again later"}, 503)
+  if allowed:
+    return jsonify({"error": "Method not allowed"}, 405)
+  return jsonify({"error": "Not found"}, 404)
+
+async def read_body(receive):
+  body = b""
+  while True:
+    message = await receive()
+    body += message.get("body", b"")
+    if not message.get("more_body"):
+      return body
+
+async def lifespan(receive, send):
+  while True:
+    message = await receive()
+    if message["type"] == "lifespan.startup":
+      start_warmup()
+      await send({"type": "lifespan.startup.complete"})
+    elif message["type"] == "lifespan.shutdown":
+      await pool.close()
+      await send({"type": "lifespan.shutdown.complete"})
+      return
+
+async def app(scope, receive, send):
+  if scope["type"] == "lifespan":
+    await lifespan(receive, send)
+    return
+  request = Request(scope, await read_body(receive))
+  status, body, headers = await dispatch(request)
+  headers = [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+  if isinstance(body, bytes):
+    headers.append((b"content-length", str(len(body)).encode()))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": b"" if request.method == "HEAD" else body})
+    return
+  # Streamed: no content-length, so the server sends it chunked
+  await send({"type": "http.response.start", "status": status, "headers": headers})
+  try:
+    if request.method != "HEAD":
+      async for chunk in body:
+        await send({"type": "http.response.body", "body": chunk, "more_body": True})
+  finally:
+    await body.aclose()
+  await send({"type": "http.response.body", "body": b""})
@@ -0,0 +1,128 @@
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import ConnectionPool
+from server import db_config
+
+# The parameterized lookups the API runs on every request
+QUERIES = [
+  ("film_inventory_total",
+   "SELECT COUNT(*) AS total_inventory FROM inventory WHERE film_id = %s",
+   lambda i: (i % 1000 + 1,)),
+  ("film_inventory_available",
+   """
+    SELECT COUNT(*) AS available_inventory
+    FROM inventory
+    WHERE film_id = %s
+      AND inventory_id NOT IN (
+          SELECT inventory_id FROM rental WHERE return_date IS NULL
+      )
+   """,
+   lambda i: (i % 1000 + 1,)),
+  ("actor_films",
+   """
+    SELECT
+      f.film_id, f.title, COUNT(r.rental_id) AS rental_count
+    FROM rental r
+    JOIN inventory i ON r.inventory_id = i.inventory_id
+    JOIN film f ON i.film_id = f.film_id
+    JOIN film_actor fa ON f.film_id = fa.film_id
+    WHERE fa.actor_id = %s
+    GROUP BY f.film_id
+    ORDER BY rental_count DESC
+    LIMIT 5
+   """,
+   lambda i: (i % 200 + 1,)),
+  ("rental_history",
+   """
+    SELECT r.rental_id, f.title, r.rental_date, r.return_date
+    FROM rental r
+    JOIN inventory i ON r.inventory_id = i.inventory_id
+    JOIN film f ON i.film_id = f.film_id
+    WHERE r.customer_id = %s
+    ORDER BY r.rental_date DESC
+   """,
+   lambda i: (i % 599 + 1,)),
+]
+
+STATUS_VARS = ("Com_stmt_prepare", "Com_stmt_execute", "Com_select", "Questions")
+
+
+def global_status(pool):
+  conn = pool.get_connection()
+  try:
+    cursor = conn.cursor()
+    cursor.execute(
+      "SHOW GLOBAL STATUS WHERE Variable_name IN (%s)" % ", ".join(["%s"] * len(STATUS_VARS)),
+      STATUS_VARS
+    )
+    status = {name: int(value) for name, value in cursor.fetchall()}
+    cursor.close()
+    return status
+  finally:
+    conn.close()
+
+
+def run_text(pool, sql, params, iterations):
+  conn = pool.get_connection()
+  try:
+    for i in range(iterations):
+      cursor = conn.cursor(dictionary=True)
+      cursor.execute(sql, params(i))
+      cursor.fetchall()
+      cursor.close()
+  finally:
+    conn.close()
+
+
+def run_prepared(pool, sql, params, iterations):
+  conn = pool.get_connection()
+  try:
+    for i in range(iterations):
+      conn.prepared_query(sql, params(i), dictionary=True)
+  finally:
+    conn.close()
+
+
+def bench(pool, runner, sql, params, iterations, threads):
+  workers = [
+    threading.Thread(target=runner, args=(pool, sql, params, iterations))
+    for _ in range(threads)
+  ]
+  before = global_status(pool)
+  start = time.perf_counter()
+  for worker in workers:
+    worker.start()
+  for worker in workers:
+    worker.join()
+  elapsed = time.perf_counter() - start
+  after = global_status(pool)
+  total = iterations * threads
+  delta = {name: after[name] - before[name] for name in STATUS_VARS}
+  return total / elapsed, elapsed * 1000 / iterations, delta
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Text protocol vs cached prepared statements")
+  parser.add_argument("--iterations", type=int, default=2000, help="queries per thread")
+  parser.add_argument("--threads", type=int, default=8)
+  args = parser.parse_args()
+
+  pool = ConnectionPool(db_config, pool_name="bench", pool_size=args.threads + 1, max_overflow=0)
+  print(f"{'query':<26}{'mode':<10}{'qps':>10}{'ms/query':>10}{'prepares':>10}{'executes':>10}")
+  for name, sql, params in QUERIES:
+    for mode, runner in (("text", run_text), ("prepared", run_prepared)):
+      qps, latency, delta = bench(pool, runner, sql, params, args.iterations, args.threads)
+      print(
+        f"{name:<26}{mode:<10}{qps:>10.0f}{latency:>10.3f}"
+        f"{delta['Com_stmt_prepare']:>10}{delta['Com_stmt_execute']:>10}"
+      )
+
+
+if __name__ == "__main__":
+  main()
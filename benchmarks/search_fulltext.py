@@ -0,0 +1,84 @@
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mysql.connector
+from server import db_config
+
+# Copies of film's title/description at a multiple of the catalog size, so
+# the film table itself is never touched.
+BENCH_TABLE = "film_search_bench"
+
+QUERIES = ["ACADEMY", "DINOSAUR", "ROBOT", "Epic Drama", "Boring Documentary"]
+
+
+def build_table(cursor, scale):
+  cursor.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+  cursor.execute(f"""
+    CREATE TABLE {BENCH_TABLE} (
+      id INT UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY,
+      film_id SMALLINT UNSIGNED NOT NULL,
+      title VARCHAR(128) NOT NULL,
+      description TEXT,
+      FULLTEXT INDEX ft_title_description (title, description)
+    ) ENGINE=InnoDB
+  """)
+  for copy in range(scale):
+    # Suffixed titles keep the copies distinct without changing the words
+    cursor.execute(
+      f"INSERT INTO {BENCH_TABLE} (film_id, title, description) "
+      "SELECT film_id, CONCAT(title, ' ', %s), description FROM film",
+      (f"V{copy}",)
+    )
+  cursor.execute(f"ANALYZE TABLE {BENCH_TABLE}")
+  cursor.fetchall()
+  cursor.execute(f"SELECT COUNT(*) FROM {BENCH_TABLE}")
+  return cursor.fetchone()[0]
+
+
+def timed(cursor, sql, params, repeat):
+  samples = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    cursor.execute(sql, params)
+    rows = cursor.fetchall()
+    samples.append((time.perf_counter() - start) * 1000)
+  return statistics.median(samples), len(rows)
+
+
+def main():
+  parser = argparse.ArgumentParser(description="LIKE vs FULLTEXT film search latency")
+  parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100])
+  parser.add_argument("--repeat", type=int, default=20)
+  args = parser.parse_args()
+
+  conn = mysql.connector.connect(**db_config)
+  conn.autocommit = True
+  cursor = conn.cursor()
+  like_sql = f"SELECT film_id FROM {BENCH_TABLE} WHERE title LIKE %s"
+  fulltext_sql = f"""
+    SELECT film_id, MATCH(title, description) AGAINST (%s) AS relevance
+    FROM {BENCH_TABLE}
+    WHERE MATCH(title, description) AGAINST (%s)
+    ORDER BY relevance DESC
+  """
+  try:
+    print(f"{'rows':>8}  {'query':<20}{'like ms':>10}{'hits':>8}{'fulltext ms':>13}{'hits':>8}")
+    for scale in args.scales:
+      rows = build_table(cursor, scale)
+      for query in QUERIES:
+        like_ms, like_hits = timed(cursor, like_sql, ('%' + query + '%',), args.repeat)
+        fulltext_ms, fulltext_hits = timed(cursor, fulltext_sql, (query, query), args.repeat)
+        print(f"{rows:>8}  {query:<20}{like_ms:>10.2f}{like_hits:>8}{fulltext_ms:>13.2f}{fulltext_hits:>8}")
+  finally:
+    cursor.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+    cursor.close()
+    conn.close()
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,70 @@
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mysql.connector
+from search_index import FuzzyIndex
+from server import db_config, fuzzy_candidates, fuzzy_max_distance
+
+
+def load_titles():
+  conn = mysql.connector.connect(**db_config)
+  try:
+    cursor = conn.cursor()
+    cursor.execute("SELECT title FROM film")
+    return [title for (title,) in cursor.fetchall()]
+  finally:
+    conn.close()
+
+
+def scaled_titles(titles, size):
+  # Real words recombined, so the trigram distribution stays realistic
+  words = sorted({word for title in titles for word in title.split()})
+  entries = [(i + 1, title) for i, title in enumerate(titles)]
+  rng = random.Random(0)
+  while len(entries) < size:
+    entries.append((len(entries) + 1, " ".join(rng.sample(words, 2))))
+  return entries
+
+
+def typo(title, rng):
+  chars = list(title)
+  i = rng.randrange(len(chars))
+  chars[i] = rng.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ")
+  return "".join(chars)
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Fuzzy title search latency")
+  parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+  parser.add_argument("--queries", type=int, default=200)
+  args = parser.parse_args()
+
+  titles = load_titles()
+  rng = random.Random(1)
+  print(f"{'titles':>8}{'build s':>10}{'p50 ms':>10}{'p99 ms':>10}{'found':>8}")
+  for size in args.sizes:
+    entries = scaled_titles(titles, size)
+    start = time.perf_counter()
+    index = FuzzyIndex(entries, candidates=fuzzy_candidates)
+    build = time.perf_counter() - start
+    samples = []
+    found = 0
+    for _ in range(args.queries):
+      film_id, title = rng.choice(entries)
+      start = time.perf_counter()
+      matches = index.search(typo(title, rng), fuzzy_max_distance)
+      samples.append((time.perf_counter() - start) * 1000)
+      found += any(key == film_id for distance, key in matches)
+    samples.sort()
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f"{len(entries):>8}{build:>10.2f}{statistics.median(samples):>10.3f}{p99:>10.3f}{found:>8}")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,355 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from blinker import Namespace
+from werkzeug.http import http_date
+
+# Data-change events raised by the write routes; caches subscribe to these
+# rather than the write routes knowing about every cache.
+signals = Namespace()
+rentals_changed = signals.signal("rentals-changed")
+customers_changed = signals.signal("customers-changed")
+films_changed = signals.signal("films-changed")
+
+
+class _Call:
+  __slots__ = ("done", "value", "failed")
+
+  def __init__(self):
+    self.done = threading.Event()
+    self.value = None
+    self.failed = False
+
+
+class SingleFlight:
+  # Collapses concurrent calls with the same key onto one execution: the
+  # first caller (leader) runs fn, the rest (followers) wait for its value.
+  # A follower that times out, or whose leader failed or produced a value
+  # it cannot share, runs fn itself.
+  def __init__(self):
+    self._calls = {}
+    self._lock = threading.Lock()
+    self._stats = {"leaders": 0, "followers": 0, "follower_timeouts": 0, "follower_fallbacks": 0}
+
+  def do(self, key, fn, timeout, shareable=None):
+    with self._lock:
+      call = self._calls.get(key)
+      leader = call is None
+      if leader:
+        call = self._calls[key] = _Call()
+        self._stats["leaders"] += 1
+      else:
+        self._stats["followers"] += 1
+
+    if leader:
+      try:
+        call.value = fn()
+        return call.value
+      except BaseException:
+        call.failed = True
+        raise
+      finally:
+        with self._lock:
+          del self._calls[key]
+        call.done.set()
+
+    if not call.done.wait(timeout):
+      with self._lock:
+        self._stats["follower_timeouts"] += 1
+      return fn()
+    if call.failed or (shareable is not None and not shareable(call.value)):
+      with self._lock:
+        self._stats["follower_fallbacks"] += 1
+      return fn()
+    return call.value
+
+  def stats(self):
+    with self._lock:
+      stats = dict(self._stats)
+      stats["in_flight"] = len(self._calls)
+    return stats
+
+
+class CachedResponse:
+  # A finished response: encoded body plus every header it is sent with,
+  # so a hit is served without touching the rows or the JSON encoder.
+  __slots__ = ("body", "etag", "last_modified", "headers", "not_modified_headers",
+               "generation", "fresh_until")
+
+  def __init__(self, body, content_type, etag, last_modified, cache_control,
+               generation=0, fresh_until=None, extra_headers=()):
+    self.body = body
+    self.etag = etag
+    self.last_modified = last_modified
+    self.generation = generation
+    # Past fresh_until the entry may still be served while it is rebuilt
+    self.fresh_until = fresh_until
+    self.not_modified_headers = [
+      ("ETag", f'"{etag}"'),
+      ("Cache-Control", cache_control)
+    ]
+    self.headers = [
+      ("Content-Type", content_type),
+      ("Content-Length", str(len(body))),
+      ("Last-Modified", http_date(last_modified))
+    ] + self.not_modified_headers + list(extra_headers)
+
+  def to_record(self):
+    # (body, JSON of everything else), for caches outside the process
+    return self.body, json.dumps({
+      "etag": self.etag,
+      "last_modified": self.last_modified.timestamp(),
+      "headers": self.headers,
+      "not_modified_headers": self.not_modified_headers,
+      "generation": self.generation,
+      "fresh_until": self.fresh_until
+    })
+
+  @classmethod
+  def from_record(cls, body, meta):
+    meta = json.loads(meta)
+    entry = cls.__new__(cls)
+    entry.body = bytes(body)
+    entry.etag = meta["etag"]
+    entry.last_modified = datetime.fromtimestamp(meta["last_modified"], timezone.utc)
+    entry.headers = [tuple(header) for header in meta["headers"]]
+    entry.not_modified_headers = [tuple(header) for header in meta["not_modified_headers"]]
+    entry.generation = meta["generation"]
+    entry.fresh_until = meta["fresh_until"]
+    return entry
+
+
+class CacheBackend:
+  # Interface for response caches. Keys are tuples whose first item is
+  # the route name, which is what invalidation and versions work on.
+  def get(self, key):
+    raise NotImplementedError
+
+  def set(self, key, value, ttl=None, generation=None):
+    raise NotImplementedError
+
+  def generation(self, route):
+    return self.version(route)[0]
+
+  def version(self, route):
+    raise NotImplementedError
+
+  def invalidate(self, *routes, drop=True):
+    # drop=False only bumps the routes' generations and leaves their
+    # entries to be served stale until they are rebuilt.
+    raise NotImplementedError
+
+  def clear(self):
+    raise NotImplementedError
+
+  def stats(self):
+    raise NotImplementedError
+
+
+class ResponseCache(CacheBackend):
+  # In-process LRU + TTL cache; each worker process has its own.
+  def __init__(self, maxsize=1024, ttl=60):
+    self.maxsize = maxsize
+    self.ttl = ttl
+    self._entries = OrderedDict()
+    self._generations = {}
+    self._modified = {}
+    self._started = time.time()
+    self._lock = threading.Lock()
+    self._stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+  def get(self, key):
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is not None:
+        expires, value = entry
+        if expires > time.monotonic():
+          self._entries.move_to_end(key)
+          self._stats["hits"] += 1
+          return value
+        del self._entries[key]
+      self._stats["misses"] += 1
+      return None
+
+  def version(self, route):
+    # (generation, wall-clock time of the last invalidation) for a route;
+    # the data behind a route is unchanged while its generation is.
+    with self._lock:
+      return self._generations.get(route, 0), self._modified.get(route, self._started)
+
+  def set(self, key, value, ttl=None, generation=None):
+    with self._lock:
+      # A write that landed while the value was being computed makes it
+      # stale before it is stored.
+      if generation is not None and generation != self._generations.get(key[0], 0):
+        return
+      self._entries[key] = (time.monotonic() + (ttl or self.ttl), value)
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.maxsize:
+        self._entries.popitem(last=False)
+        self._stats["evictions"] += 1
+
+  def invalidate(self, *routes, drop=True):
+    now = time.time()
+    with self._lock:
+      for route in routes:
+        self._generations[route] = self._generations.get(route, 0) + 1
+        self._modified[route] = now
+      if not drop:
+        return
+      stale = [key for key in self._entries if key[0] in routes]
+      for key in stale:
+        del self._entries[key]
+      self._stats["invalidations"] += len(stale)
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+
+  def stats(self):
+    with self._lock:
+      stats = dict(self._stats)
+      stats["size"] = len(self._entries)
+    stats["maxsize"] = self.maxsize
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_ratio"] = stats["hits"] / lookups if lookups else 0.0
+    return stats
+
+
+class SharedCache(CacheBackend):
+  # Cross-process cache of CachedResponses in a local SQLite file (WAL
+  # mode) that every worker opens. Generations live in the same file, so
+  # an invalidation committed by one worker is seen by the next lookup in
+  # any other. Eviction past maxsize drops the entries closest to
+  # expiring. Entries are stored as plain columns, never pickled, and the
+  # file must sit in a directory only this user can write.
+  def __init__(self, path, maxsize=1024, ttl=60, busy_timeout=5.0):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    info = os.stat(directory)
+    if info.st_uid != os.getuid() or info.st_mode & 0o022:
+      raise RuntimeError(f"{directory} must be owned and only writable by the cache's user")
+    if os.path.exists(path) and os.stat(path).st_uid != os.getuid():
+      raise RuntimeError(f"{path} is owned by another user")
+    self.path = path
+    self.maxsize = maxsize
+    self.ttl = ttl
+    self.busy_timeout = busy_timeout
+    self._local = threading.local()
+    self._lock = threading.Lock()
+    self._stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+    with self._write() as db:
+      # Older files held pickled values under this name, and a start time
+      # that outlived restarts in meta
+      db.execute("DROP TABLE IF EXISTS entries")
+      db.execute("DROP TABLE IF EXISTS meta")
+      db.execute("""CREATE TABLE IF NOT EXISTS responses (
+        key TEXT PRIMARY KEY, route TEXT NOT NULL, expires REAL NOT NULL,
+        body BLOB NOT NULL, meta TEXT NOT NULL)""")
+      db.execute("CREATE INDEX IF NOT EXISTS responses_route ON responses (route)")
+      db.execute("CREATE INDEX IF NOT EXISTS responses_expires ON responses (expires)")
+      db.execute("""CREATE TABLE IF NOT EXISTS generations (
+        route TEXT PRIMARY KEY, generation INTEGER NOT NULL, modified REAL NOT NULL)""")
+    # Routes never invalidated count as modified when this process
+    # started, as in ResponseCache.
+    self._started = time.time()
+
+  def _db(self):
+    # One autocommit connection per thread, reopened after a fork.
+    db = getattr(self._local, "db", None)
+    if db is None or self._local.pid != os.getpid():
+      db = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+      db.execute("PRAGMA journal_mode=WAL")
+      db.execute("PRAGMA synchronous=NORMAL")
+      self._local.db = db
+      self._local.pid = os.getpid()
+    return db
+
+  def _write(self):
+    return _Transaction(self._db())
+
+  def _count(self, name, n=1):
+    with self._lock:
+      self._stats[name] += n
+
+  def get(self, key):
+    row = self._db().execute(
+      "SELECT body, meta FROM responses WHERE key = ? AND expires > ?", (repr(key), time.time())
+    ).fetchone()
+    if row is None:
+      self._count("misses")
+      return None
+    self._count("hits")
+    return CachedResponse.from_record(*row)
+
+  def set(self, key, value, ttl=None, generation=None):
+    with self._write() as db:
+      if generation is not None and generation != self._generation(db, key[0]):
+        return
+      db.execute(
+        "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+        (repr(key), key[0], time.time() + (ttl or self.ttl), *value.to_record())
+      )
+      excess = db.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.maxsize
+      if excess > 0:
+        db.execute(
+          "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY expires LIMIT ?)",
+          (excess,)
+        )
+        self._count("evictions", excess)
+
+  def _generation(self, db, route):
+    row = db.execute("SELECT generation FROM generations WHERE route = ?", (route,)).fetchone()
+    return row[0] if row else 0
+
+  def version(self, route):
+    row = self._db().execute(
+      "SELECT generation, modified FROM generations WHERE route = ?", (route,)
+    ).fetchone()
+    return row if row else (0, self._started)
+
+  def invalidate(self, *routes, drop=True):
+    now = time.time()
+    with self._write() as db:
+      for route in routes:
+        db.execute(
+          """INSERT INTO generations VALUES (?, 1, ?)
+          ON CONFLICT (route) DO UPDATE SET generation = generation + 1, modified = excluded.modified""",
+          (route, now)
+        )
+        if not drop:
+          continue
+        removed = db.execute("DELETE FROM responses WHERE route = ?", (route,)).rowcount
+        self._count("invalidations", removed)
+
+  def clear(self):
+    with self._write() as db:
+      db.execute("DELETE FROM responses")
+
+  def stats(self):
+    size = self._db().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+    with self._lock:
+      stats = dict(self._stats)
+    stats["size"] = size
+    stats["maxsize"] = self.maxsize
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_ratio"] = stats["hits"] / lookups if lookups else 0.0
+    return stats
+
+
+class _Transaction:
+  # BEGIN IMMEDIATE/COMMIT around a write on an autocommit connection.
+  def __init__(self, db):
+    self.db = db
+
+  def __enter__(self):
+    self.db.execute("BEGIN IMMEDIATE")
+    return self.db
+
+  def __exit__(self, exc_type, exc, tb):
+    self.db.execute("ROLLBACK" if exc_type else "COMMIT")
@@ -0,0 +1,180 @@
+import bisect
+import threading
+import time
+from collections import Counter
+
+FILM_COLUMNS = (
+  "film_id", "title", "description", "release_year", "language_id",
+  "original_language_id", "rental_duration", "rental_rate", "length",
+  "replacement_cost", "rating", "special_features", "last_update"
+)
+
+FILM_SELECT = "SELECT " + ", ".join(FILM_COLUMNS) + " FROM film"
+FILM_CATEGORY_SELECT = "SELECT film_id, category_id FROM film_category"
+
+
+class Film:
+  # Values are stored already converted to their JSON form.
+  __slots__ = FILM_COLUMNS + ("category_ids",)
+
+  def __init__(self, row, convert):
+    for name in FILM_COLUMNS:
+      value = row[name]
+      if name == "special_features" and isinstance(value, str):
+        value = value.split(',')
+      setattr(self, name, convert(value))
+    self.category_ids = ()
+
+  def to_dict(self):
+    return {name: getattr(self, name) for name in FILM_COLUMNS}
+
+
+class FilmCatalog:
+  # Every film row, with its category ids, held in process. refresh()
+  # polls COUNT/MAX(last_update) and reloads only what changed.
+  def __init__(self, convert, refresh_interval=30):
+    self.convert = convert
+    self.refresh_interval = refresh_interval
+    self._films = {}
+    self._count = None
+    self._last_update = None
+    self._checked = 0.0
+    self._lock = threading.Lock()
+    self.loaded = False
+    # Bumped on every change, for indexes built from the films
+    self.version = 0
+
+  def __len__(self):
+    return len(self._films)
+
+  def get(self, film_id):
+    return self._films.get(film_id)
+
+  def films(self):
+    return list(self._films.values())
+
+  def needs_refresh(self):
+    return not self.loaded or time.monotonic() - self._checked >= self.refresh_interval
+
+  def refresh(self, db, force=False):
+    # Returns True when the catalog changed. Only one thread refreshes;
+    # the rest keep serving the current films unless nothing is loaded.
+    if not self._lock.acquire(blocking=not self.loaded):
+      return False
+    try:
+      if not force and not self.needs_refresh():
+        return False
+      cursor = db.cursor(dictionary=True)
+      cursor.execute("SELECT COUNT(*) AS films, MAX(last_update) AS last_update FROM film")
+      state = cursor.fetchone()
+      self._checked = time.monotonic()
+      if self.loaded and state["films"] == self._count and state["last_update"] == self._last_update:
+        return False
+
+      incremental = self.loaded and state["films"] == self._count
+      if incremental:
+        # Same rows, some edited: >= also picks up edits made in the same
+        # second as the last refresh.
+        cursor.execute(FILM_SELECT + " WHERE last_update >= %s", (self._last_update,))
+        films = dict(self._films)
+      else:
+        cursor.execute(FILM_SELECT)
+        films = {}
+      loaded = [Film(row, self.convert) for row in cursor.fetchall()]
+      if loaded:
+        sql = FILM_CATEGORY_SELECT
+        if incremental:
+          sql += " WHERE film_id IN (" + ", ".join(["%s"] * len(loaded)) + ")"
+          cursor.execute(sql, [film.film_id for film in loaded])
+        else:
+          cursor.execute(sql)
+        categories = {}
+        for row in cursor.fetchall():
+          categories.setdefault(row["film_id"], []).append(row["category_id"])
+        for film in loaded:
+          film.category_ids = tuple(categories.get(film.film_id, ()))
+          films[film.film_id] = film
+
+      self._films = films
+      self._count = state["films"]
+      self._last_update = state["last_update"]
+      self.loaded = True
+      self.version += 1
+      return True
+    finally:
+      self._lock.release()
+
+
+class Dimensions:
+  # The small lookup tables, reloaded whole every refresh_interval
+  # seconds. categories and languages map ids to names; stores and staff
+  # map ids to rows.
+  SELECTS = {
+    "categories": "SELECT category_id AS id, name FROM category",
+    "languages": "SELECT language_id AS id, name FROM language",
+    "stores": "SELECT store_id AS id, store_id, manager_staff_id, address_id FROM store",
+    "staff": "SELECT staff_id AS id, staff_id, first_name, last_name, store_id, active FROM staff"
+  }
+
+  def __init__(self, refresh_interval=300):
+    self.refresh_interval = refresh_interval
+    self.categories = {}
+    self.languages = {}
+    self.stores = {}
+    self.staff = {}
+    self._checked = 0.0
+    self._lock = threading.Lock()
+    self.loaded = False
+
+  def needs_refresh(self):
+    return not self.loaded or time.monotonic() - self._checked >= self.refresh_interval
+
+  def refresh(self, db, force=False):
+    if not self._lock.acquire(blocking=not self.loaded):
+      return False
+    try:
+      if not force and not self.needs_refresh():
+        return False
+      cursor = db.cursor(dictionary=True)
+      for name, sql in self.SELECTS.items():
+        cursor.execute(sql)
+        rows = cursor.fetchall()
+        if name in ("categories", "languages"):
+          setattr(self, name, {row["id"]: row["name"] for row in rows})
+        else:
+          setattr(self, name, {row.pop("id"): row for row in rows})
+      self._checked = time.monotonic()
+      self.loaded = True
+      return True
+    finally:
+      self._lock.release()
+
+  def category_ids(self, query):
+    # Ids of the categories whose name contains query, ignoring case
+    query = query.casefold()
+    return sorted(category_id for category_id, name in self.categories.items() if query in name.casefold())
+
+
+def bucket_labels(edges):
+  # "<a", "a-b", ..., "z+" for the ranges [-inf, a), [a, b), ..., [z, inf)
+  edges = [f"{edge:g}" for edge in edges]
+  return ["<" + edges[0]] + [f"{lo}-{hi}" for lo, hi in zip(edges, edges[1:])] + [edges[-1] + "+"]
+
+
+def facet_counts(films, length_buckets, rental_rate_buckets, dimensions=None):
+  # Every facet counted in one pass over the films. With dimensions,
+  # categories and languages are counted by name.
+  length_labels = bucket_labels(length_buckets)
+  rate_labels = bucket_labels(rental_rate_buckets)
+  facets = {name: Counter() for name in ("rating", "category", "language", "length", "rental_rate")}
+  for film in films:
+    facets["rating"][film.rating] += 1
+    facets["category"].update(film.category_ids)
+    facets["language"][film.language_id] += 1
+    if film.length is not None:
+      facets["length"][length_labels[bisect.bisect_right(length_buckets, film.length)]] += 1
+    facets["rental_rate"][rate_labels[bisect.bisect_right(rental_rate_buckets, film.rental_rate)]] += 1
+  if dimensions is not None:
+    for name, names in (("category", dimensions.categories), ("language", dimensions.languages)):
+      facets[name] = Counter({names.get(key, key): count for key, count in facets[name].items()})
+  return {name: dict(counts) for name, counts in facets.items()}
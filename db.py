@@ -0,0 +1,364 @@
+import asyncio
+import threading
+import time
+
+import mysql.connector
+import mysql.connector.aio
+from mysql.connector import errors
+from mysql.connector.pooling import MySQLConnectionPool, PooledMySQLConnection
+
+
+class StatementCache:
+  # Prepared cursors for one physical connection, keyed by SQL text. The
+  # server-side statements die with the session, so the cache is tied to
+  # the connection_id it was built for.
+  def __init__(self, connection_id):
+    self.connection_id = connection_id
+    self._statements = {}
+
+  def get(self, cnx, sql, dictionary):
+    key = (sql, dictionary)
+    entry = self._statements.get(key)
+    if entry is not None:
+      return entry, False
+    # The prepared cursor re-prepares unless execute() gets the very
+    # same string object, so the string is kept alongside the cursor.
+    entry = (sql.strip().rstrip(";"), cnx.cursor(prepared=True, dictionary=dictionary))
+    self._statements[key] = entry
+    return entry, True
+
+
+class PooledConnection:
+  # Proxy handed out by ConnectionPool; close() gives the connection back
+  # instead of tearing down the socket.
+  def __init__(self, pool, cnx, overflow):
+    self._pool = pool
+    self._cnx = cnx
+    self.overflow = overflow
+
+  def __getattr__(self, attr):
+    return getattr(self._cnx, attr)
+
+  @property
+  def raw(self):
+    if isinstance(self._cnx, PooledMySQLConnection):
+      return self._cnx._cnx
+    return self._cnx
+
+  def prepared_query(self, sql, params=(), dictionary=False):
+    raw = self.raw
+    cache = getattr(raw, "statement_cache", None)
+    if cache is None or cache.connection_id != raw.connection_id:
+      cache = raw.statement_cache = StatementCache(raw.connection_id)
+    (sql, cursor), prepared = cache.get(raw, sql, dictionary)
+    self._pool.count_statement(prepared)
+    cursor.execute(sql, params)
+    return cursor.fetchall()
+
+  def set_max_execution_time(self, ms):
+    # Session variables survive checkin, so only send SET when this
+    # physical session is not already on the requested budget.
+    raw = self.raw
+    key = (raw.connection_id, ms)
+    if getattr(raw, "session_max_execution_time", None) != key:
+      cursor = raw.cursor()
+      cursor.execute("SET SESSION MAX_EXECUTION_TIME = %s", (ms,))
+      cursor.close()
+      raw.session_max_execution_time = key
+
+  def close(self):
+    if self._cnx is not None:
+      self._pool.release(self)
+
+
+class ConnectionPool:
+  def __init__(self, config, pool_name="sakila", pool_size=10, max_overflow=5,
+               pool_timeout=5.0, pool_reset_session=False):
+    self.config = dict(config)
+    self.pool_name = pool_name
+    self.pool_size = pool_size
+    self.max_overflow = max_overflow
+    self.pool_timeout = pool_timeout
+    self.pool_reset_session = pool_reset_session
+    self._pool = None
+    self._lock = threading.Lock()
+    self._slots = threading.BoundedSemaphore(pool_size + max_overflow)
+    self._stats = {
+      "checkouts": 0,
+      "overflow_checkouts": 0,
+      "in_use": 0,
+      "exhausted": 0,
+      "timeouts": 0,
+      "health_check_failures": 0,
+      "wait_time_total_ms": 0.0,
+      "wait_time_max_ms": 0.0,
+      "statements_prepared": 0,
+      "statements_reused": 0,
+    }
+
+  def _get_pool(self):
+    # Built on first checkout so importing the app does not need a live server.
+    if self._pool is None:
+      with self._lock:
+        if self._pool is None:
+          self._pool = MySQLConnectionPool(
+            pool_name=self.pool_name,
+            pool_size=self.pool_size,
+            pool_reset_session=self.pool_reset_session,
+            **self.config
+          )
+    return self._pool
+
+  def warmup(self):
+    # MySQLConnectionPool opens all pool_size connections when built.
+    self._get_pool()
+
+  def ping(self):
+    # Health check that never waits for a slot and never builds the pool
+    # or opens an overflow connection. Returns "idle" before the first
+    # checkout, "busy" when no pooled connection is free (every one is in
+    # use, so not down), else "ok" once a free one answers a ping.
+    # Raises when that ping and the reconnect behind it fail.
+    if self._pool is None:
+      return "idle"
+    if not self._slots.acquire(blocking=False):
+      return "busy"
+    try:
+      try:
+        cnx = self._pool.get_connection()
+      except errors.PoolError:
+        return "busy"
+      except errors.InterfaceError:
+        with self._lock:
+          self._stats["health_check_failures"] += 1
+        raise
+      cnx.close()
+      return "ok"
+    finally:
+      self._slots.release()
+
+  def get_connection(self):
+    start = time.perf_counter()
+    if not self._slots.acquire(blocking=False):
+      with self._lock:
+        self._stats["exhausted"] += 1
+      if not self._slots.acquire(timeout=self.pool_timeout):
+        with self._lock:
+          self._stats["timeouts"] += 1
+        raise errors.PoolError("Failed getting connection; pool exhausted")
+    wait_ms = (time.perf_counter() - start) * 1000
+
+    try:
+      cnx, overflow = self._checkout()
+    except Exception:
+      self._slots.release()
+      raise
+
+    with self._lock:
+      self._stats["checkouts"] += 1
+      self._stats["in_use"] += 1
+      self._stats["wait_time_total_ms"] += wait_ms
+      self._stats["wait_time_max_ms"] = max(self._stats["wait_time_max_ms"], wait_ms)
+      if overflow:
+        self._stats["overflow_checkouts"] += 1
+    return PooledConnection(self, cnx, overflow)
+
+  def _checkout(self):
+    pool = self._get_pool()
+    try:
+      # get_connection() pings the connection and reconnects it when the
+      # ping fails; a failed reconnect is the health check failing.
+      return pool.get_connection(), False
+    except errors.PoolError:
+      return mysql.connector.connect(**self.config), True
+    except errors.InterfaceError:
+      with self._lock:
+        self._stats["health_check_failures"] += 1
+      raise
+
+  def release(self, conn):
+    cnx, conn._cnx = conn._cnx, None
+    try:
+      cnx.close()
+    except errors.Error:
+      # A broken connection still goes back; the next checkout's ping
+      # reconnects it.
+      pass
+    finally:
+      with self._lock:
+        self._stats["in_use"] -= 1
+      self._slots.release()
+
+  def count_statement(self, prepared):
+    with self._lock:
+      if prepared:
+        self._stats["statements_prepared"] += 1
+      else:
+        self._stats["statements_reused"] += 1
+
+  def stats(self):
+    with self._lock:
+      stats = dict(self._stats)
+    stats["pool_size"] = self.pool_size
+    stats["max_overflow"] = self.max_overflow
+    if stats["checkouts"]:
+      stats["wait_time_avg_ms"] = stats["wait_time_total_ms"] / stats["checkouts"]
+    else:
+      stats["wait_time_avg_ms"] = 0.0
+    return stats
+
+
+class DBSession:
+  # One lazily acquired connection per request; close() always hands it back.
+  def __init__(self, pool, max_execution_time=None):
+    self.pool = pool
+    self.max_execution_time = max_execution_time
+    self._conn = None
+    self._cursors = []
+    self.wrote = False
+
+  @property
+  def connection(self):
+    if self._conn is None:
+      conn = self.pool.get_connection()
+      try:
+        if self.max_execution_time is not None:
+          conn.set_max_execution_time(self.max_execution_time)
+      except Exception:
+        conn.close()
+        raise
+      self._conn = conn
+    return self._conn
+
+  def cursor(self, **kwargs):
+    cursor = self.connection.cursor(**kwargs)
+    self._cursors.append(cursor)
+    return cursor
+
+  def prepared_query(self, sql, params=(), dictionary=False):
+    return self.connection.prepared_query(sql, params, dictionary)
+
+  def commit(self):
+    self.connection.commit()
+    self.wrote = True
+
+  def rollback(self):
+    if self._conn is not None:
+      self._conn.rollback()
+
+  def close(self, error=None):
+    conn, self._conn = self._conn, None
+    cursors, self._cursors = self._cursors, []
+    if conn is None:
+      return
+    try:
+      for cursor in cursors:
+        cursor.close()
+      # Sessions are not reset on checkin (that would drop the prepared
+      # statements), so end the request's transaction here.
+      conn.rollback()
+    except errors.Error:
+      pass
+    finally:
+      conn.close()
+
+
+class AsyncConnectionPool:
+  # mysql.connector.aio has no pool of its own; this keeps idle
+  # connections in a LIFO list and caps concurrency with a semaphore.
+  def __init__(self, config, pool_size=10, pool_timeout=5.0):
+    self.config = dict(config)
+    self.pool_size = pool_size
+    self.pool_timeout = pool_timeout
+    self._idle = []
+    self._slots = asyncio.Semaphore(pool_size)
+    self._stats = {
+      "checkouts": 0,
+      "connects": 0,
+      "in_use": 0,
+      "exhausted": 0,
+      "timeouts": 0,
+      "health_check_failures": 0,
+      "wait_time_total_ms": 0.0,
+      "wait_time_max_ms": 0.0,
+    }
+
+  async def get_connection(self):
+    start = time.perf_counter()
+    if self._slots.locked():
+      self._stats["exhausted"] += 1
+    try:
+      await asyncio.wait_for(self._slots.acquire(), self.pool_timeout)
+    except asyncio.TimeoutError:
+      self._stats["timeouts"] += 1
+      raise errors.PoolError("Failed getting connection; pool exhausted") from None
+    wait_ms = (time.perf_counter() - start) * 1000
+
+    try:
+      cnx = await self._checkout()
+    except BaseException:
+      self._slots.release()
+      raise
+
+    self._stats["checkouts"] += 1
+    self._stats["in_use"] += 1
+    self._stats["wait_time_total_ms"] += wait_ms
+    self._stats["wait_time_max_ms"] = max(self._stats["wait_time_max_ms"], wait_ms)
+    return cnx
+
+  async def _checkout(self):
+    while self._idle:
+      cnx = self._idle.pop()
+      if await cnx.is_connected():
+        return cnx
+      self._stats["health_check_failures"] += 1
+      try:
+        await cnx.close()
+      except errors.Error:
+        pass
+    self._stats["connects"] += 1
+    return await mysql.connector.aio.connect(**self.config)
+
+  async def ping(self):
+    # Same contract as ConnectionPool.ping(): never waits for a slot and
+    # connects only when no pooled connection is left to answer.
+    if self._slots.locked():
+      return "busy"
+    if not self._idle and not self._stats["connects"]:
+      return "idle"
+    await self._slots.acquire()
+    try:
+      self._idle.append(await self._checkout())
+      return "ok"
+    finally:
+      self._slots.release()
+
+  async def release(self, cnx):
+    try:
+      await cnx.rollback()
+      self._idle.append(cnx)
+    except errors.Error:
+      try:
+        await cnx.close()
+      except errors.Error:
+        pass
+    finally:
+      self._stats["in_use"] -= 1
+      self._slots.release()
+
+  async def close(self):
+    idle, self._idle = self._idle, []
+    for cnx in idle:
+      try:
+        await cnx.close()
+      except errors.Error:
+        pass
+
+  def stats(self):
+    stats = dict(self._stats)
+    stats["pool_size"] = self.pool_size
+    if stats["checkouts"]:
+      stats["wait_time_avg_ms"] = stats["wait_time_total_ms"] / stats["checkouts"]
+    else:
+      stats["wait_time_avg_ms"] = 0.0
+    return stats
@@ -0,0 +1,11 @@
+-- Per-film rental counts, kept current by rent_film and delete_customer.
+-- Populate or repair with: flask --app server rebuild-rental-stats
+CREATE TABLE IF NOT EXISTS film_rental_stats (
+  film_id SMALLINT UNSIGNED NOT NULL,
+  rental_count INT UNSIGNED NOT NULL DEFAULT 0,
+  last_update TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (film_id),
+  KEY idx_rental_count (rental_count),
+  CONSTRAINT fk_film_rental_stats_film FOREIGN KEY (film_id)
+    REFERENCES film (film_id) ON DELETE CASCADE ON UPDATE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
@@ -0,0 +1,2 @@
+-- Full-text index behind /search?type=film&mode=fulltext
+ALTER TABLE film ADD FULLTEXT INDEX ft_film_title_description (title, description);
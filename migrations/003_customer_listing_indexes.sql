@@ -0,0 +1,8 @@
+-- Indexes behind /customers keyset pages: each sort order, alone and
+-- under the store_id/active filters. InnoDB appends customer_id to every
+-- secondary index, which is the keyset tie-breaker. last_name alone is
+-- already covered by sakila's idx_last_name.
+ALTER TABLE customer
+  ADD INDEX idx_create_date (create_date),
+  ADD INDEX idx_store_active_last_name (store_id, active, last_name),
+  ADD INDEX idx_store_active_create_date (store_id, active, create_date);
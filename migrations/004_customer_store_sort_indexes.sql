@@ -0,0 +1,11 @@
+-- /customers?store_id= without active. 003's (store_id, active, <sort>)
+-- indexes cannot return such a page in sort order, since active comes
+-- between. Coverage per filter, after this file:
+--   none               PRIMARY, idx_last_name, idx_create_date
+--   store_id           idx_fk_store_id (customer_id order), and these
+--   store_id + active  idx_fk_store_id, idx_store_active_*
+--   active             the unfiltered indexes, skipping inactive rows;
+--                      sakila's customers are nearly all active
+ALTER TABLE customer
+  ADD INDEX idx_store_last_name (store_id, last_name),
+  ADD INDEX idx_store_create_date (store_id, create_date);
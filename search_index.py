@@ -0,0 +1,284 @@
+import bisect
+import heapq
+import threading
+import time
+from collections import Counter
+
+
+def trigrams(text):
+  return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def edit_distance(a, b, limit):
+  # Levenshtein distance, or None once it is certain to exceed limit
+  if abs(len(a) - len(b)) > limit:
+    return None
+  previous = list(range(len(b) + 1))
+  for i, char in enumerate(a, 1):
+    current = [i]
+    for j, other in enumerate(b, 1):
+      current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char != other)))
+    if min(current) > limit:
+      return None
+    previous = current
+  return previous[-1] if previous[-1] <= limit else None
+
+
+class TrigramIndex:
+  # Inverted index from each 3-character substring of a value to the ids
+  # holding it. A query's trigrams narrow the ids to candidates that are
+  # then checked against the stored values, so results are exactly the
+  # case-insensitive substring matches.
+  def __init__(self):
+    self._values = {}
+    self._postings = {}
+    self._lock = threading.Lock()
+
+  def __len__(self):
+    return len(self._values)
+
+  def add(self, key, value):
+    value = value.casefold()
+    with self._lock:
+      self._discard(key)
+      self._values[key] = value
+      for gram in trigrams(value):
+        self._postings.setdefault(gram, set()).add(key)
+
+  def remove(self, key):
+    with self._lock:
+      self._discard(key)
+
+  def _discard(self, key):
+    value = self._values.pop(key, None)
+    if value is None:
+      return
+    for gram in trigrams(value):
+      keys = self._postings[gram]
+      keys.discard(key)
+      if not keys:
+        del self._postings[gram]
+
+  def search(self, query):
+    query = query.casefold()
+    with self._lock:
+      grams = trigrams(query)
+      if grams:
+        postings = sorted((self._postings.get(gram, set()) for gram in grams), key=len)
+        candidates = postings[0].intersection(*postings[1:])
+      else:
+        # Queries under three characters have no trigrams to look up
+        candidates = self._values
+      return sorted(key for key in candidates if query in self._values[key])
+
+
+class NameIndex:
+  # Trigram indexes over name columns of one table, keyed by its primary
+  # key. fields maps each index to the SQL expression it is built from.
+  # Writes made by this process are applied with add()/remove(); refresh()
+  # polls COUNT/MAX(last_update) to pick up everyone else's.
+  def __init__(self, table, key, fields, refresh_interval=30):
+    self.table = table
+    self.key = key
+    self.fields = fields
+    self.refresh_interval = refresh_interval
+    self._indexes = {field: TrigramIndex() for field in fields}
+    self._count = None
+    self._last_update = None
+    self._checked = 0.0
+    self._lock = threading.Lock()
+    self.loaded = False
+
+  def __len__(self):
+    return len(next(iter(self._indexes.values())))
+
+  def search(self, field, query):
+    return self._indexes[field].search(query)
+
+  def add(self, key, row):
+    # Before the first load there is nothing to keep current.
+    if not self.loaded:
+      return
+    for field, index in self._indexes.items():
+      index.add(key, row[field] or "")
+
+  def remove(self, key):
+    for index in self._indexes.values():
+      index.remove(key)
+
+  def needs_refresh(self):
+    return not self.loaded or time.monotonic() - self._checked >= self.refresh_interval
+
+  def refresh(self, db, force=False):
+    # Returns True when the index changed. Same locking as FilmCatalog.
+    if not self._lock.acquire(blocking=not self.loaded):
+      return False
+    try:
+      if not force and not self.needs_refresh():
+        return False
+      cursor = db.cursor(dictionary=True)
+      cursor.execute(f"SELECT COUNT(*) AS total, MAX(last_update) AS last_update FROM {self.table}")
+      state = cursor.fetchone()
+      self._checked = time.monotonic()
+      if self.loaded and state["total"] == self._count and state["last_update"] == self._last_update:
+        return False
+
+      columns = ", ".join(f"{sql} AS {field}" for field, sql in self.fields.items())
+      sql = f"SELECT {self.key} AS id, {columns} FROM {self.table}"
+      if self.loaded and state["total"] == self._count:
+        cursor.execute(sql + " WHERE last_update >= %s", (self._last_update,))
+        indexes = self._indexes
+      else:
+        cursor.execute(sql)
+        indexes = {field: TrigramIndex() for field in self.fields}
+      for row in cursor.fetchall():
+        for field, index in indexes.items():
+          index.add(row["id"], row[field] or "")
+
+      self._indexes = indexes
+      self._count = state["total"]
+      self._last_update = state["last_update"]
+      self.loaded = True
+      return True
+    finally:
+      self._lock.release()
+
+
+class PrefixIndex:
+  # Sorted array of lowercased keys searched with bisect. Every word of a
+  # name starts a key, so "gui" completes "PENELOPE GUINESS". Completions
+  # rank by score, then name; the top ones for one- and two-character
+  # prefixes, which cover the most keys, are worked out up front.
+  def __init__(self, entries, limit=10):
+    self.limit = limit
+    self._names = {}
+    self._scores = {}
+    keys = []
+    for key, name, score in entries:
+      self._names[key] = name
+      self._scores[key] = score
+      words = name.casefold().split()
+      for i in range(len(words)):
+        keys.append((" ".join(words[i:]), key))
+    keys.sort()
+    self._keys = [text for text, key in keys]
+    self._ids = [key for text, key in keys]
+    self._top = {}
+    for length in (1, 2):
+      for prefix in {text[:length] for text in self._keys}:
+        self._top[prefix] = self._rank(prefix, limit)
+
+  def __len__(self):
+    return len(self._names)
+
+  def _rank(self, prefix, limit):
+    lo = bisect.bisect_left(self._keys, prefix)
+    hi = bisect.bisect_left(self._keys, prefix + "\U0010ffff", lo)
+    return heapq.nsmallest(limit, set(self._ids[lo:hi]),
+                           key=lambda key: (-self._scores[key], self._names[key]))
+
+  def complete(self, prefix, limit=None):
+    # (id, name, score) for the best names with a word starting with prefix
+    prefix = " ".join(prefix.casefold().split())
+    limit = min(limit or self.limit, self.limit)
+    if not prefix:
+      return []
+    top = self._top.get(prefix)
+    keys = top[:limit] if top is not None else self._rank(prefix, limit)
+    return [(key, self._names[key], self._scores[key]) for key in keys]
+
+
+class Suggestions:
+  # A PrefixIndex per search type, each rebuilt from its source every
+  # refresh_interval seconds or after expire(). sources maps a type to a
+  # function of a DB session returning (id, name, score) rows. index()
+  # never builds, so callers can keep completing against the old index
+  # while refresh() runs elsewhere.
+  def __init__(self, sources, refresh_interval=60, limit=10):
+    self.sources = sources
+    self.refresh_interval = refresh_interval
+    self.limit = limit
+    self._indexes = {}
+    self._built = {}
+    self._expired = {kind: 0 for kind in sources}
+    self._locks = {kind: threading.Lock() for kind in sources}
+
+  def expire(self, kind):
+    # Counted rather than flagged, so an expire() during a rebuild that
+    # read the source before it is not lost.
+    self._expired[kind] += 1
+
+  def needs_refresh(self, kind):
+    built = self._built.get(kind)
+    return (built is None or built[1] != self._expired[kind]
+            or time.monotonic() - built[0] >= self.refresh_interval)
+
+  def index(self, kind):
+    return self._indexes.get(kind)
+
+  def refresh(self, kind, db):
+    lock = self._locks[kind]
+    if not lock.acquire(blocking=kind not in self._indexes):
+      return False
+    try:
+      if not self.needs_refresh(kind):
+        return False
+      started, expired = time.monotonic(), self._expired[kind]
+      self._indexes[kind] = PrefixIndex(self.sources[kind](db), limit=self.limit)
+      self._built[kind] = (started, expired)
+      return True
+    finally:
+      lock.release()
+
+
+class FuzzyIndex:
+  # Typo-tolerant lookup over fixed values. The values sharing the most
+  # trigrams with the query (padded, so word edges count) are the only
+  # ones given an edit distance, which bounds the work per query. A query
+  # is measured against each run of as many words in the value, so it may
+  # name part of it; values containing the query exactly are distance 0.
+  def __init__(self, entries, candidates=64):
+    self.candidates = candidates
+    self._values = {}
+    self._postings = {}
+    for key, value in entries:
+      value = " ".join(value.casefold().split())
+      self._values[key] = value
+      for gram in trigrams(f" {value} "):
+        self._postings.setdefault(gram, []).append(key)
+
+  def __len__(self):
+    return len(self._values)
+
+  def search(self, query, max_distance):
+    # [(distance, id)] within max_distance of query, closest first
+    query = " ".join(query.casefold().split())
+    grams = trigrams(f" {query} ")
+    shared = Counter()
+    for gram in grams:
+      shared.update(self._postings.get(gram, ()))
+    # An edit changes at most three trigrams, so a value sharing fewer
+    # than this many cannot be within max_distance.
+    needed = len(grams) - 3 * max_distance
+    matches = []
+    for key, count in shared.most_common(self.candidates):
+      if count < needed:
+        break
+      distance = self._distance(query, self._values[key], max_distance)
+      if distance is not None:
+        matches.append((distance, key))
+    return sorted(matches)
+
+  def _distance(self, query, value, limit):
+    if query in value:
+      return 0
+    words = value.split()
+    size = query.count(" ") + 1
+    if size >= len(words):
+      return edit_distance(query, value, limit)
+    best = None
+    for i in range(len(words) - size + 1):
+      distance = edit_distance(query, " ".join(words[i:i + size]), limit)
+      if distance is not None and (best is None or distance < best):
+        best = limit = distance
+    return best
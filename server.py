@@ -1,7 +1,19 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request, stream_with_context
+import base64
+import functools
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+import json
 import mysql.connector
-from datetime import datetime
+import os
+import threading
+import time
+from datetime import datetime, timezone
 from decimal import Decimal
+from db import ConnectionPool, DBSession
+from cache import CachedResponse, ResponseCache, SharedCache, SingleFlight, customers_changed, films_changed, rentals_changed
+from catalog import Dimensions, FilmCatalog, facet_counts
+from search_index import FuzzyIndex, NameIndex, Suggestions
 
 app = Flask(__name__)
 
@@ -13,6 +25,562 @@ db_config = {
   "database": "sakila"
 }
 
+# Connection pool config
+pool_config = {
+  "pool_size": 10,
+  "max_overflow": 5,
+  "pool_timeout": 5.0
+}
+
+# Read replica config; None sends reads to the primary,
+# e.g. dict(db_config, port=3307) for a second local mysqld
+replica_config = None
+
+# Seconds a client's reads stay on the primary after it writes
+read_your_writes_window = 5
+
+# Per-route SELECT time budgets in milliseconds, enforced server-side
+# through MAX_EXECUTION_TIME; 0 means no limit
+default_query_budget = 5000
+# Streamed SELECTs run until the client has read the last row, so they
+# get their own budget instead of their route's. It is also the most a
+# streamed body may take to send, however slowly the client reads.
+stream_query_budget = 60000
+query_budgets = {
+  "search_films": 2000,
+  "search_customers": 2000,
+  "get_customers": 3000,
+  "get_film_inventory": 1000,
+  "get_customer_rental_history": 2000
+}
+
+# Response cache backend: "memory" keeps one cache per worker process,
+# "shared" puts one cache in a SQLite file every local worker opens, so
+# aggregates are computed once and invalidations reach all workers. The
+# file's directory must be writable by the service user only.
+cache_backend = "memory"
+shared_cache_path = os.path.join(
+  os.environ.get("XDG_RUNTIME_DIR") or os.path.expanduser("~/.cache"), "sakila", "response_cache.db"
+)
+
+# Response cache config; per-route TTLs in seconds override the default
+cache_config = {
+  "maxsize": 1024,
+  "ttl": 60
+}
+cache_ttls = {
+  "top_rented_films": 300,
+  "top_actors": 300,
+  "actor_films": 300,
+  "search": 120,
+  "customers": 30,
+  "customers/search": 30
+}
+
+# Routes whose cache misses are coalesced so concurrent requests share one
+# query, with how long followers wait (seconds) before querying themselves
+coalesce_timeouts = {
+  "top_rented_films": 5.0,
+  "top_actors": 5.0,
+  "actor_films": 2.0
+}
+
+# Stale-while-revalidate routes: (soft TTL, hard TTL) in seconds. Past the
+# soft TTL, or after a write touches the route, the cached response is
+# still served while a background worker rebuilds it; past the hard TTL it
+# is gone and the next request recomputes it
+swr_policies = {
+  "top_rented_films": (10, 300),
+  "top_actors": (60, 900),
+  "actor_films": (10, 300)
+}
+swr_workers = 4
+
+# Cache-Control sent with each cached route; no-cache makes clients
+# revalidate every time, which is cheap once they hold an ETag
+default_cache_control = "no-cache"
+cache_control_policies = {
+  "top_rented_films": "public, max-age=30",
+  "top_actors": "public, max-age=300",
+  "actor_films": "public, max-age=60",
+  "search": "public, max-age=60",
+  "rental_history": "private, no-cache"
+}
+
+# Cached routes to drop when each kind of data changes
+invalidated_by = {
+  rentals_changed: ("top_rented_films", "film_inventory", "actor_films", "rental_history"),
+  customers_changed: ("customers", "customers/search"),
+  films_changed: ("top_rented_films", "actor_films", "search", "rental_history")
+}
+
+# Seconds between checks of film.last_update for catalog changes
+catalog_refresh_interval = 30
+
+# Seconds between reloads of category, language, store and staff
+dimension_refresh_interval = 300
+
+# Headers set by views that are kept with their cached responses
+CACHED_HEADERS = ("X-Next-Cursor",)
+
+# /search page size when no limit is given, and the most a limit can ask for
+search_page_size = 50
+search_max_page_size = 200
+
+# Bucket edges for the length (minutes) and rental_rate facets of
+# /search?facets=true
+facet_length_buckets = (60, 90, 120, 150)
+facet_rental_rate_buckets = (1, 3)
+
+# mode=fuzzy: the most edits a title may be from the query (fewer for
+# short queries), and how many trigram candidates are edit-checked
+fuzzy_max_distance = 3
+fuzzy_candidates = 64
+
+# ?stream= values for the list routes, sent as chunked bodies instead of
+# one buffered JSON document, and the rows fetched and encoded per chunk
+STREAM_FORMATS = {
+  "json": "application/json",
+  "ndjson": "application/x-ndjson"
+}
+stream_chunk_size = 500
+# Endpoints that honour ?stream=; everywhere else it is ignored
+STREAMED_ENDPOINTS = {"get_customers", "search_films", "get_customer_rental_history"}
+# Streams running at once, each holding a pooled connection until its
+# client has read the body; past this they get a 503. Kept below the
+# pool's size so buffered requests always find a connection.
+max_concurrent_streams = 4
+# Rows a streamed response sends at most, with or without ?limit=
+stream_max_rows = 100000
+
+# /customers page size when no limit is given, and the most a limit can ask for
+customers_page_size = 100
+customers_max_page_size = 500
+
+# How much each kind of match adds to a film's score in /search?type=all
+search_all_weights = {
+  "film": 3,
+  "actor": 2,
+  "genre": 1
+}
+
+# /search/suggest: most completions returned, and seconds between
+# rebuilds of each type's index as rental counts move
+suggest_limit = 10
+suggest_refresh_interval = 60
+
+# Requests replayed at startup to prime connections, statements and caches
+warmup_paths = [
+  "/top_rented_films",
+  "/top_actors",
+  "/search?type=film&query=a",
+  "/search/suggest?type=film&q=a"
+]
+warmup_retry_interval = 5
+
+# film_rental_stats rollup maintenance, run in the same transaction as
+# the rental rows they account for
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), "migrations")
+RENTAL_STATS_MIGRATION = os.path.join(MIGRATIONS_DIR, "001_film_rental_stats.sql")
+RENTAL_STATS_INCREMENT_SQL = """
+  INSERT INTO film_rental_stats (film_id, rental_count)
+  VALUES (%s, 1)
+  ON DUPLICATE KEY UPDATE rental_count = rental_count + 1
+"""
+RENTAL_STATS_DECREMENT_CUSTOMER_SQL = """
+  UPDATE film_rental_stats s
+  JOIN (
+    SELECT i.film_id, COUNT(*) AS rentals
+    FROM rental r
+    JOIN inventory i ON r.inventory_id = i.inventory_id
+    WHERE r.customer_id = %s
+    GROUP BY i.film_id
+  ) d ON s.film_id = d.film_id
+  SET s.rental_count = GREATEST(CAST(s.rental_count AS SIGNED) - d.rentals, 0)
+"""
+RENTAL_STATS_REBUILD_SQL = """
+  INSERT INTO film_rental_stats (film_id, rental_count)
+  SELECT f.film_id, COUNT(r.rental_id)
+  FROM film f
+  LEFT JOIN inventory i ON i.film_id = f.film_id
+  LEFT JOIN rental r ON r.inventory_id = i.inventory_id
+  GROUP BY f.film_id
+  ON DUPLICATE KEY UPDATE rental_count = VALUES(rental_count)
+"""
+
+# Names and rental counts behind /search/suggest; films come from the
+# catalog. Actors and genres score the rentals of all their films.
+SUGGEST_SQL = {
+  "actor": """
+    SELECT a.actor_id, CONCAT_WS(' ', a.first_name, a.last_name), COALESCE(SUM(s.rental_count), 0)
+    FROM actor a
+    LEFT JOIN film_actor fa ON fa.actor_id = a.actor_id
+    LEFT JOIN film_rental_stats s ON s.film_id = fa.film_id
+    GROUP BY a.actor_id
+  """,
+  "genre": """
+    SELECT c.category_id, c.name, COALESCE(SUM(s.rental_count), 0)
+    FROM category c
+    LEFT JOIN film_category fc ON fc.category_id = c.category_id
+    LEFT JOIN film_rental_stats s ON s.film_id = fc.film_id
+    GROUP BY c.category_id
+  """,
+  "customer": """
+    SELECT c.customer_id, CONCAT_WS(' ', c.first_name, c.last_name), COUNT(r.rental_id)
+    FROM customer c
+    LEFT JOIN rental r ON r.customer_id = c.customer_id
+    GROUP BY c.customer_id
+  """
+}
+
+# MySQL errors that mean a migration has already been applied
+MIGRATION_APPLIED_ERRNOS = (
+  mysql.connector.errorcode.ER_DUP_KEYNAME,
+  mysql.connector.errorcode.ER_TABLE_EXISTS_ERROR
+)
+
+# MySQL errors raised when a statement is interrupted
+QUERY_TIMEOUT_ERRNOS = (
+  mysql.connector.errorcode.ER_QUERY_TIMEOUT,
+  mysql.connector.errorcode.ER_QUERY_INTERRUPTED
+)
+
+pool = ConnectionPool(db_config, **pool_config)
+replica_pool = None
+if replica_config is not None:
+  replica_pool = ConnectionPool(replica_config, pool_name="sakila_replica", **pool_config)
+
+PRIMARY_PIN_COOKIE = "db_primary_until"
+
+if cache_backend == "shared":
+  response_cache = SharedCache(shared_cache_path, **cache_config)
+else:
+  response_cache = ResponseCache(**cache_config)
+
+single_flight = SingleFlight()
+
+swr_executor = ThreadPoolExecutor(max_workers=swr_workers, thread_name_prefix="revalidate")
+swr_lock = threading.Lock()
+swr_refreshing = set()
+swr_stats = {"stale_served": 0, "refreshes": 0, "refresh_errors": 0}
+
+def connect_invalidation(signal, routes):
+  swr_routes = tuple(route for route in routes if route in swr_policies)
+  other_routes = tuple(route for route in routes if route not in swr_policies)
+  def invalidate(sender, **extra):
+    if other_routes:
+      response_cache.invalidate(*other_routes)
+    if swr_routes:
+      response_cache.invalidate(*swr_routes, drop=False)
+  signal.connect(invalidate, weak=False)
+
+for signal, routes in invalidated_by.items():
+  connect_invalidation(signal, routes)
+
+def not_modified(etag, last_modified=None):
+  # If-None-Match wins over If-Modified-Since (RFC 9110 13.2.2). Dates are
+  # only given for cache hits: an entry's is when its body was rendered,
+  # so a client that fetched at or after it cannot hold an older body.
+  if request.if_none_match:
+    return request.if_none_match.contains(etag)
+  if request.if_modified_since is not None and last_modified is not None:
+    return request.if_modified_since >= last_modified
+  return False
+
+def get_catalog():
+  db = get_db()
+  if film_catalog.needs_refresh() and film_catalog.refresh(db):
+    films_changed.send(app)
+  return film_catalog
+
+def get_dimensions():
+  if dimensions.needs_refresh():
+    dimensions.refresh(get_db())
+  return dimensions
+
+def catalog_films(film_ids):
+  # Films added since the last refresh force one early reload.
+  catalog = get_catalog()
+  if any(catalog.get(film_id) is None for film_id in film_ids):
+    if catalog.refresh(get_db(), force=True):
+      films_changed.send(app)
+  return film_rows(catalog, get_dimensions(), film_ids)
+
+def film_rows(catalog, dims, film_ids):
+  # Response dicts for the films in the catalog, named language and
+  # categories included, without any queries
+  films = []
+  for film_id in film_ids:
+    film = catalog.get(film_id)
+    if film is None:
+      continue
+    row = film.to_dict()
+    row["language"] = dims.languages.get(film.language_id)
+    row["categories"] = [dims.categories.get(category_id) for category_id in film.category_ids]
+    films.append(row)
+  return films
+
+def encode_cursor(*key):
+  # Opaque keyset cursor: the sort key of the last row on a page
+  return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+def decode_cursor(cursor, *types):
+  # The sort key a cursor holds, None for no cursor; ValueError if it is
+  # not one of ours. types gives the type (or tuple of types) of each part.
+  if not cursor:
+    return None
+  try:
+    key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+  except (ValueError, TypeError):
+    raise ValueError("Invalid cursor")
+  if (not isinstance(key, list) or len(key) != len(types)
+      or not all(isinstance(part, kind) and not isinstance(part, bool) for part, kind in zip(key, types))):
+    raise ValueError("Invalid cursor")
+  return key
+
+def page_limit(default, maximum):
+  # Streams are bounded by stream_max_rows rather than the page size
+  if stream_format() is not None:
+    default = maximum = stream_max_rows
+  return min(max(request.args.get('limit', default, type=int), 1), maximum)
+
+def fetch_count(limit):
+  # Rows to read: a page reads one past limit to learn whether a next
+  # page exists; a stream sends exactly limit rows
+  return limit if stream_format() is not None else limit + 1
+
+def stream_format():
+  stream = request.args.get('stream')
+  if request.endpoint not in STREAMED_ENDPOINTS:
+    return None
+  return stream if stream in STREAM_FORMATS else None
+
+def cursor_chunks(cursor):
+  # fetchmany() batches off an unbuffered cursor. A client that goes away
+  # mid-stream leaves rows unread; they are drained so the connection can
+  # go back to the pool.
+  try:
+    while True:
+      rows = cursor.fetchmany(stream_chunk_size)
+      if not rows:
+        return
+      yield rows
+  except GeneratorExit:
+    while cursor.fetchmany(stream_chunk_size):
+      pass
+    raise
+
+def list_chunks(rows):
+  for start in range(0, len(rows), stream_chunk_size):
+    yield rows[start:start + stream_chunk_size]
+
+def stream_rows(chunks):
+  # Encodes each chunk of rows as it is produced, as one JSON array or as
+  # NDJSON, so neither the rows nor the body are ever held whole.
+  stream = stream_format()
+  dumps = app.json.dumps
+  def encode():
+    if stream == "ndjson":
+      for rows in chunks:
+        if rows:
+          yield "".join(dumps(row) + "\n" for row in rows)
+      return
+    separator = "["
+    for rows in chunks:
+      if rows:
+        yield separator + ",".join(dumps(row) for row in rows)
+        separator = ","
+    yield "[]" if separator == "[" else "]"
+  deadline = time.monotonic() + stream_query_budget / 1000
+  def generate():
+    # The 200 is already sent when a chunk fails. NDJSON ends with an
+    # error line; either way the exception aborts the chunked body before
+    # its final chunk, so the client sees an incomplete response rather
+    # than a short, well-formed one.
+    try:
+      for chunk in encode():
+        yield chunk
+        if time.monotonic() > deadline:
+          raise TimeoutError("Streamed response exceeded its time budget")
+    except Exception as err:
+      app.logger.exception("Streamed %s response failed", request.path)
+      timed_out = isinstance(err, TimeoutError) or (
+        isinstance(err, mysql.connector.Error) and err.errno in QUERY_TIMEOUT_ERRNOS)
+      if timed_out:
+        count_cancelled_query()
+      if stream == "ndjson":
+        message = "Query exceeded its time budget" if timed_out else "Response failed"
+        yield dumps({"error": message}) + "\n"
+      raise
+  # The request context, and with it g.db, lives until the body is sent
+  return Response(stream_with_context(generate()), mimetype=STREAM_FORMATS[stream])
+
+def page_response(rows, next_cursor):
+  response = jsonify(rows)
+  if next_cursor is not None:
+    response.headers["X-Next-Cursor"] = next_cursor
+  return response
+
+def render_entry(route, key, view, kwargs, generation):
+  # Runs the view and caches a 200 as a CachedResponse; anything else is
+  # returned as the view's own response.
+  response = app.make_response(view(**kwargs))
+  if response.status_code != 200:
+    return response
+  body = response.get_data()
+  etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+  last_modified = datetime.fromtimestamp(int(time.time()), timezone.utc)
+  policy = swr_policies.get(route)
+  if policy is not None:
+    fresh_until, ttl = time.time() + policy[0], policy[1]
+  else:
+    fresh_until, ttl = None, cache_ttls.get(route)
+  entry = CachedResponse(body, response.content_type, etag, last_modified,
+                         cache_control_policies.get(route, default_cache_control),
+                         generation=generation, fresh_until=fresh_until,
+                         extra_headers=[(name, response.headers[name]) for name in CACHED_HEADERS
+                                        if name in response.headers])
+  response_cache.set(key, entry, ttl=ttl, generation=generation)
+  return entry
+
+def revalidate(route, key, view, kwargs, path, query_string):
+  try:
+    with app.test_request_context(path, query_string=query_string):
+      # Whoever triggered the refresh may have just written; a lagging
+      # replica would be stored as fresh.
+      g.read_primary = True
+      render_entry(route, key, view, kwargs, response_cache.generation(route))
+    with swr_lock:
+      swr_stats["refreshes"] += 1
+  except Exception:
+    app.logger.exception("Background refresh of %s failed", path)
+    with swr_lock:
+      swr_stats["refresh_errors"] += 1
+  finally:
+    with swr_lock:
+      swr_refreshing.discard(key)
+
+def schedule_revalidate(route, key, view, kwargs):
+  with swr_lock:
+    swr_stats["stale_served"] += 1
+    if key in swr_refreshing:
+      return
+    swr_refreshing.add(key)
+  swr_executor.submit(revalidate, route, key, view, kwargs, request.path,
+                      request.query_string.decode("latin-1"))
+
+stream_slots = threading.BoundedSemaphore(max_concurrent_streams)
+stream_stats = {"rejected": 0}
+
+def streamed(view, kwargs):
+  # The slot is held until the WSGI server closes the body
+  if not stream_slots.acquire(blocking=False):
+    with query_stats_lock:
+      stream_stats["rejected"] += 1
+    return jsonify({"error": "Too many streamed responses, try again later"}), 503
+  try:
+    response = app.make_response(view(**kwargs))
+  except BaseException:
+    stream_slots.release()
+    raise
+  response.call_on_close(stream_slots.release)
+  return response
+
+def cached(route):
+  def decorator(view):
+    @functools.wraps(view)
+    def wrapper(**kwargs):
+      # Streamed bodies are never buffered, so never cached
+      if stream_format() is not None:
+        return streamed(view, kwargs)
+      # Pinned clients read the primary to see their own writes, which the
+      # cache may predate.
+      if replica_pool is not None and primary_pinned():
+        return view(**kwargs)
+      key = (route, tuple(sorted(kwargs.items())), tuple(sorted(request.args.items(multi=True))))
+      # Invalidation drops entries except on stale-while-revalidate routes,
+      # whose entries are served until the background rebuild replaces them.
+      entry = response_cache.get(key)
+      if entry is not None:
+        if entry.fresh_until is not None and (
+            time.time() >= entry.fresh_until or entry.generation != response_cache.generation(route)):
+          schedule_revalidate(route, key, view, kwargs)
+        if not_modified(entry.etag, entry.last_modified):
+          return Response(status=304, headers=entry.not_modified_headers)
+        return Response(entry.body, headers=entry.headers)
+
+      # A miss always renders, and only an ETag matching the new body
+      # gets a 304: the client's date says nothing about the new body.
+      generation, modified = response_cache.version(route)
+
+      def render():
+        # Replicas may not have the write behind a recent invalidation yet,
+        # and whatever is rendered now is cached for everyone.
+        g.read_primary = time.time() - modified < read_your_writes_window
+        return render_entry(route, key, view, kwargs, generation)
+
+      if route in coalesce_timeouts:
+        # The generation is part of the key so requests arriving after a
+        # write never wait on a leader reading pre-write data.
+        result = single_flight.do((key, generation), render, coalesce_timeouts[route],
+                                  shareable=lambda value: isinstance(value, CachedResponse))
+      else:
+        result = render()
+      if isinstance(result, CachedResponse):
+        if not_modified(result.etag):
+          return Response(status=304, headers=result.not_modified_headers)
+        return Response(result.body, headers=result.headers)
+      return result
+    return wrapper
+  return decorator
+
+warmup_lock = threading.Lock()
+warmup_state = {"started": False, "ready": False, "attempts": 0, "duration_ms": None, "error": None}
+
+query_stats_lock = threading.Lock()
+query_stats = {"cancelled": 0, "cancelled_by_route": {}}
+
+def primary_pinned():
+  # The cookie is the client's to set, so a pin can never run past what
+  # pin_reads_after_write would have issued just now.
+  pinned_until = request.cookies.get(PRIMARY_PIN_COOKIE, type=float)
+  now = time.time()
+  return pinned_until is not None and now < pinned_until <= now + read_your_writes_window
+
+def pool_for_request():
+  if replica_pool is None or request.method not in ("GET", "HEAD"):
+    return pool
+  if g.get("read_primary") or primary_pinned():
+    return pool
+  return replica_pool
+
+def get_db():
+  if "db" not in g:
+    if stream_format() is not None:
+      budget = stream_query_budget
+    else:
+      budget = query_budgets.get(request.endpoint, default_query_budget)
+    g.db = DBSession(pool_for_request(), max_execution_time=budget)
+  return g.db
+
+@app.after_request
+def pin_reads_after_write(response):
+  db = g.get("db")
+  if replica_pool is not None and db is not None and db.wrote:
+    response.set_cookie(
+      PRIMARY_PIN_COOKIE,
+      str(time.time() + read_your_writes_window),
+      max_age=read_your_writes_window,
+      httponly=True
+    )
+  return response
+
+@app.teardown_appcontext
+def close_db(error):
+  db = g.pop("db", None)
+  if db is not None:
+    db.close(error)
+
 def convert_data(obj):
   if isinstance(obj, datetime):
     return obj.strftime('%Y-%m-%d %H:%M:%S')
@@ -22,42 +590,207 @@ def convert_data(obj):
     return list(obj)
   return obj
 
+film_catalog = FilmCatalog(convert_data, refresh_interval=catalog_refresh_interval)
+dimensions = Dimensions(refresh_interval=dimension_refresh_interval)
+
+# Substring search over names runs against these instead of LIKE scans
+actor_names = NameIndex("actor", "actor_id", {"name": "CONCAT_WS(' ', first_name, last_name)"},
+                        refresh_interval=catalog_refresh_interval)
+customer_names = NameIndex("customer", "customer_id", {"first_name": "first_name", "last_name": "last_name"},
+                           refresh_interval=catalog_refresh_interval)
+
+def update_customer_names(sender, customer_id=None, customer=None, **extra):
+  if customer_id is None:
+    return
+  if customer is None:
+    customer_names.remove(customer_id)
+  else:
+    customer_names.add(customer_id, customer)
+
+customers_changed.connect(update_customer_names, weak=False)
+
+def film_suggestions(db):
+  cursor = db.cursor()
+  cursor.execute("SELECT film_id, rental_count FROM film_rental_stats")
+  counts = dict(cursor.fetchall())
+  return [(film.film_id, film.title, counts.get(film.film_id, 0)) for film in get_catalog().films()]
+
+def query_suggestions(sql):
+  def source(db):
+    cursor = db.cursor()
+    cursor.execute(sql)
+    return [(key, name, int(score)) for key, name, score in cursor.fetchall()]
+  return source
+
+suggestions = Suggestions(
+  dict({"film": film_suggestions}, **{kind: query_suggestions(sql) for kind, sql in SUGGEST_SQL.items()}),
+  refresh_interval=suggest_refresh_interval,
+  limit=suggest_limit
+)
+customers_changed.connect(lambda sender, **extra: suggestions.expire("customer"), weak=False)
+
+suggest_refreshing = set()
+
+def refresh_suggestions(kind):
+  try:
+    with app.test_request_context("/search/suggest", query_string={"type": kind}):
+      # Rebuilds after a write must see it
+      g.read_primary = True
+      suggestions.refresh(kind, get_db())
+  except Exception:
+    app.logger.exception("Background rebuild of %s suggestions failed", kind)
+  finally:
+    with swr_lock:
+      suggest_refreshing.discard(kind)
+
+def schedule_suggestions_refresh(kind):
+  # Rebuilding takes seconds at 100k names; requests keep the old index.
+  with swr_lock:
+    if kind in suggest_refreshing:
+      return
+    suggest_refreshing.add(kind)
+  swr_executor.submit(refresh_suggestions, kind)
+
+title_index_lock = threading.Lock()
+title_index = (None, None)
+
+def get_title_index():
+  # Rebuilt from the catalog whenever the catalog changes
+  global title_index
+  catalog = get_catalog()
+  version, index = title_index
+  if version != catalog.version:
+    with title_index_lock:
+      version, index = title_index
+      if version != catalog.version:
+        version = catalog.version
+        index = FuzzyIndex(((film.film_id, film.title) for film in catalog.films()),
+                           candidates=fuzzy_candidates)
+        title_index = (version, index)
+  return index
+
+def fuzzy_title_matches(query_param):
+  max_distance = max(1, min(fuzzy_max_distance, len(query_param) // 4))
+  return get_title_index().search(query_param, max_distance)
+
+def get_actor_names():
+  if actor_names.needs_refresh():
+    actor_names.refresh(get_db())
+  return actor_names
+
+def get_customer_names():
+  # A reload means another process changed customers
+  if customer_names.needs_refresh() and customer_names.refresh(get_db()):
+    customers_changed.send(app)
+  return customer_names
+
+def count_cancelled_query():
+  with query_stats_lock:
+    query_stats["cancelled"] += 1
+    by_route = query_stats["cancelled_by_route"]
+    by_route[request.endpoint] = by_route.get(request.endpoint, 0) + 1
+
+@app.errorhandler(mysql.connector.errors.PoolError)
+def handle_pool_error(err):
+  return jsonify({"error": "Database busy, try again later"}), 503
+
+@app.errorhandler(mysql.connector.Error)
+def handle_query_timeout(err):
+  if err.errno not in QUERY_TIMEOUT_ERRNOS:
+    raise err
+  count_cancelled_query()
+  return jsonify({"error": "Query exceeded its time budget"}), 504
+
+def warmup():
+  start = time.perf_counter()
+  while True:
+    warmup_state["attempts"] += 1
+    try:
+      pool.warmup()
+      if replica_pool is not None:
+        replica_pool.warmup()
+      db = DBSession(pool)
+      try:
+        dimensions.refresh(db, force=True)
+      finally:
+        db.close()
+      client = app.test_client()
+      for path in warmup_paths:
+        response = client.get(path)
+        if response.status_code != 200:
+          raise RuntimeError(f"{path} returned {response.status_code}")
+    except Exception as err:
+      warmup_state["error"] = str(err)
+      time.sleep(warmup_retry_interval)
+      continue
+    warmup_state["error"] = None
+    warmup_state["duration_ms"] = (time.perf_counter() - start) * 1000
+    warmup_state["ready"] = True
+    return
+
+def start_warmup():
+  # Called from __main__, and by the first /ready probe for servers that
+  # import the app (gunicorn etc.), so importing has no side effects.
+  with warmup_lock:
+    if warmup_state["started"]:
+      return
+    warmup_state["started"] = True
+  threading.Thread(target=warmup, name="warmup", daemon=True).start()
+
+@app.route('/ready', methods=['GET'])
+def get_ready():
+  start_warmup()
+  status = 200 if warmup_state["ready"] else 503
+  return jsonify(warmup_state), status
+
+@app.route('/health', methods=['GET'])
+def get_health():
+  try:
+    state = pool.ping()
+  except mysql.connector.Error as err:
+    return jsonify({"status": "unavailable", "error": str(err)}), 503
+  return jsonify({"status": "ok", "pool": state})
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+  with query_stats_lock:
+    queries = {"cancelled": query_stats["cancelled"],
+               "cancelled_by_route": dict(query_stats["cancelled_by_route"])}
+    streams = dict(stream_stats)
+  metrics = {"pool": pool.stats(), "queries": queries, "cache": response_cache.stats(),
+             "single_flight": single_flight.stats(), "streams": streams}
+  with swr_lock:
+    metrics["stale_while_revalidate"] = dict(swr_stats, refreshing=len(swr_refreshing))
+  if replica_pool is not None:
+    metrics["replica_pool"] = replica_pool.stats()
+  return jsonify(metrics)
+
 @app.route('/top_rented_films', methods=['GET'])
+@cached('top_rented_films')
 def get_top_rented_films():
-  conn = mysql.connector.connect(**db_config)
-  cursor = conn.cursor(dictionary=True)
+  db = get_db()
+  cursor = db.cursor()
   query = """
-    SELECT 
-      f.film_id, f.title, f.description, f.release_year, f.language_id, 
-      f.original_language_id, f.rental_duration, f.rental_rate, f.length, 
-      f.replacement_cost, f.rating, f.special_features, f.last_update,
-      COUNT(r.rental_id) AS rental_count
-    FROM rental r
-    JOIN inventory i ON r.inventory_id = i.inventory_id
-    JOIN film f ON i.film_id = f.film_id
-    GROUP BY f.film_id
-    ORDER BY rental_count DESC
+    SELECT s.film_id, s.rental_count
+    FROM film_rental_stats s
+    WHERE s.rental_count > 0
+    ORDER BY s.rental_count DESC
     LIMIT 5;
   """
   cursor.execute(query)
-  films = cursor.fetchall()
+  counts = cursor.fetchall()
+  rental_counts = dict(counts)
+  films = catalog_films([film_id for film_id, rental_count in counts])
   for film in films:
-    for key, value in film.items():
-      if key == "special_features" and isinstance(value, str):
-        film[key] = value.split(',')
-      else:
-        film[key] = convert_data(value)
-  cursor.close()
-  conn.close()
+    film["rental_count"] = rental_counts[film["film_id"]]
   return jsonify(films)
 
 @app.route('/film_inventory/<int:film_id>', methods=['GET'])
+@cached('film_inventory')
 def get_film_inventory(film_id):
-  conn = mysql.connector.connect(**db_config)
-  cursor = conn.cursor(dictionary=True)
+  db = get_db()
   
-  cursor.execute("SELECT COUNT(*) AS total_inventory FROM inventory WHERE film_id = %s", (film_id,))
-  total = cursor.fetchone()
+  total = db.prepared_query("SELECT COUNT(*) AS total_inventory FROM inventory WHERE film_id = %s", (film_id,), dictionary=True)[0]
   
   available_query = """
     SELECT COUNT(*) AS available_inventory 
@@ -67,11 +800,7 @@ def get_film_inventory(film_id):
           SELECT inventory_id FROM rental WHERE return_date IS NULL
       )
   """
-  cursor.execute(available_query, (film_id,))
-  available = cursor.fetchone()
-  
-  cursor.close()
-  conn.close()
+  available = db.prepared_query(available_query, (film_id,), dictionary=True)[0]
   
   return jsonify({
     "total_inventory": total["total_inventory"],
@@ -92,8 +821,8 @@ def return_film():
   
   customer_str = str(customer_id).strip() if customer_id is not None else ""
   
-  conn = mysql.connector.connect(**db_config)
-  cursor = conn.cursor()
+  db = get_db()
+  cursor = db.cursor()
   
   if rental_id:
     update_query = """
@@ -103,13 +832,10 @@ def return_film():
     """
     cursor.execute(update_query, (rental_id,))
     if cursor.rowcount == 0:
-      conn.commit()
-      cursor.close()
-      conn.close()
+      db.commit()
       return jsonify({"error": "Rental not found or already returned"}), 400
-    conn.commit()
-    cursor.close()
-    conn.close()
+    db.commit()
+    rentals_changed.send(app)
     return jsonify({"message": "Film returned successfully", "rental_id": rental_id})
   
   elif customer_str == "0":
@@ -119,10 +845,9 @@ def return_film():
       WHERE return_date IS NULL
     """
     cursor.execute(update_query)
-    conn.commit()
+    db.commit()
+    rentals_changed.send(app)
     affected = cursor.rowcount
-    cursor.close()
-    conn.close()
     return jsonify({
       "message": "All films returned successfully",
       "returned_count": affected
@@ -153,8 +878,6 @@ def return_film():
     
     result = cursor.fetchone()
     if not result:
-      cursor.close()
-      conn.close()
       return jsonify({"error": "No active rental found for the provided customer/film"}), 400
     
     rental_id = result[0]
@@ -164,15 +887,15 @@ def return_film():
       WHERE rental_id = %s
     """
     cursor.execute(update_query, (rental_id,))
-    conn.commit()
-    cursor.close()
-    conn.close()
+    db.commit()
+    rentals_changed.send(app)
     return jsonify({"message": "Film returned successfully", "rental_id": rental_id})
 
 @app.route('/top_actors', methods=['GET'])
+@cached('top_actors')
 def get_top_actors():
-  conn = mysql.connector.connect(**db_config)
-  cursor = conn.cursor(dictionary=True)
+  db = get_db()
+  cursor = db.cursor(dictionary=True)
   query = """
     SELECT 
       a.actor_id, 
@@ -187,93 +910,232 @@ def get_top_actors():
   """
   cursor.execute(query)
   actors = cursor.fetchall()
-  cursor.close()
-  conn.close()
   return jsonify(actors)
 
 @app.route('/actor_films/<int:actor_id>', methods=['GET'])
+@cached('actor_films')
 def get_actor_top_films(actor_id):
-  conn = mysql.connector.connect(**db_config)
-  cursor = conn.cursor(dictionary=True)
+  db = get_db()
   query = """
     SELECT 
-      f.film_id, f.title, COUNT(r.rental_id) AS rental_count
-    FROM rental r
-    JOIN inventory i ON r.inventory_id = i.inventory_id
-    JOIN film f ON i.film_id = f.film_id
-    JOIN film_actor fa ON f.film_id = fa.film_id
-    WHERE fa.actor_id = %s
-    GROUP BY f.film_id
-    ORDER BY rental_count DESC
+      f.film_id, f.title, s.rental_count
+    FROM film_actor fa
+    JOIN film_rental_stats s ON fa.film_id = s.film_id
+    JOIN film f ON fa.film_id = f.film_id
+    WHERE fa.actor_id = %s AND s.rental_count > 0
+    ORDER BY s.rental_count DESC
     LIMIT 5;
   """
-  cursor.execute(query, (actor_id,))
-  films = cursor.fetchall()
-  cursor.close()
-  conn.close()
+  films = db.prepared_query(query, (actor_id,), dictionary=True)
   return jsonify(films)
 
+def film_match_sql(search_type, query_param, search_mode="substring"):
+  # (sql, params) selecting the distinct film_ids that match one search
+  # type, or None when nothing can match
+  if search_type == "film" and search_mode == "fulltext":
+    return "SELECT f.film_id FROM film f WHERE MATCH(f.title, f.description) AGAINST (%s)", (query_param,)
+  if search_type == "film" and search_mode == "fuzzy":
+    film_ids = [film_id for distance, film_id in fuzzy_title_matches(query_param)]
+    if not film_ids:
+      return None
+    return f"SELECT f.film_id FROM film f WHERE f.film_id IN ({', '.join(['%s'] * len(film_ids))})", tuple(film_ids)
+  if search_type == "film":
+    return "SELECT f.film_id FROM film f WHERE f.title LIKE %s", ('%' + query_param + '%',)
+  if search_type == "actor":
+    actor_ids = get_actor_names().search("name", query_param)
+    if not actor_ids:
+      return None
+    # film_actor's primary key leads with actor_id
+    placeholders = ", ".join(["%s"] * len(actor_ids))
+    return f"SELECT DISTINCT fa.film_id FROM film_actor fa WHERE fa.actor_id IN ({placeholders})", tuple(actor_ids)
+  if search_type == "genre":
+    category_ids = get_dimensions().category_ids(query_param)
+    if not category_ids:
+      return None
+    # film_category is indexed on category_id
+    placeholders = ", ".join(["%s"] * len(category_ids))
+    return f"SELECT DISTINCT fc.film_id FROM film_category fc WHERE fc.category_id IN ({placeholders})", tuple(category_ids)
+  return None
+
 @app.route('/search', methods=['GET'])
+@cached('search')
 def search_films():
     search_type = request.args.get('type')
     query_param = request.args.get('query')
+    search_mode = request.args.get('mode', 'substring')
+    if search_mode not in ("substring", "fulltext", "fuzzy"):
+        return jsonify({"error": "mode must be substring, fulltext or fuzzy"}), 400
     if not search_type or not query_param:
         return jsonify([])
-    conn = mysql.connector.connect(**db_config)
-    cursor = conn.cursor(dictionary=True)
-    
-    columns = """
-      f.film_id, f.title, f.description, f.release_year,
-      f.language_id, f.original_language_id, f.rental_duration,
-      f.rental_rate, f.length, f.replacement_cost, f.rating,
-      f.special_features, f.last_update
-    """
+    # Pages are keyset: the cursor holds the sort key of the previous
+    # page's last film: (film_id,), (score, film_id) when ranked, or
+    # (distance, -rental_count, film_id) for fuzzy titles.
+    limit = page_limit(search_page_size, search_max_page_size)
+    fuzzy = search_type == "film" and search_mode == "fuzzy"
+    ranked = search_type == "all" or (search_type == "film" and search_mode == "fulltext")
+    try:
+        if fuzzy:
+            after = decode_cursor(request.args.get('cursor'), int, int, int)
+        elif ranked:
+            after = decode_cursor(request.args.get('cursor'), (int, float), int)
+        else:
+            after = decode_cursor(request.args.get('cursor'), int)
+    except ValueError as err:
+        return jsonify({"error": str(err)}), 400
+    stream = stream_format()
+    facets_requested = request.args.get('facets', '').lower() in ("1", "true")
+    if stream is not None and facets_requested:
+        return jsonify({"error": "facets cannot be streamed"}), 400
+    if stream is not None:
+        # Loaded up front: nothing may query the connection mid-stream
+        catalog, dims = get_catalog(), get_dimensions()
+    db = get_db()
+    cursor = db.cursor()
     
-    if search_type == "film":
-        sql = f"""
-        SELECT {columns}
+    # Each branch yields its matches, sort key last, in chunks; pages
+    # flatten them and streams render them chunk by chunk.
+    # Only ids come back from MySQL; the rows come from the film catalog.
+    if search_type == "film" and search_mode == "fulltext":
+        # Uses the FULLTEXT index from migrations/002_film_fulltext.sql
+        sql = """
+        SELECT f.film_id, MATCH(f.title, f.description) AGAINST (%s) AS relevance
         FROM film f
-        WHERE f.title LIKE %s
+        WHERE MATCH(f.title, f.description) AGAINST (%s)
         """
-        cursor.execute(sql, ('%' + query_param + '%', ))
+        params = [query_param, query_param]
+        if after is not None:
+            sql += " HAVING relevance < %s OR (relevance = %s AND f.film_id > %s)"
+            params += [after[0], after[0], after[1]]
+        sql += " ORDER BY relevance DESC, f.film_id"
+        sql += " LIMIT %s"
+        params.append(fetch_count(limit))
+        cursor.execute(sql, params)
+        chunks = ([(relevance, film_id) for film_id, relevance in rows] for rows in cursor_chunks(cursor))
     
-    elif search_type == "actor":
-        sql = f"""
-        SELECT DISTINCT {columns}
-        FROM film f
-        JOIN film_actor fa ON f.film_id = fa.film_id
-        JOIN actor a ON fa.actor_id = a.actor_id
-        WHERE CONCAT_WS(' ', a.first_name, a.last_name) LIKE %s
-        """
-        cursor.execute(sql, ('%' + query_param + '%', ))
+    elif fuzzy:
+        # Closest titles first, then the most rented; MySQL is only asked
+        # for the candidates' rental counts.
+        distances = dict((film_id, distance) for distance, film_id in fuzzy_title_matches(query_param))
+        rental_counts = {}
+        if distances:
+            cursor.execute(
+                f"SELECT film_id, rental_count FROM film_rental_stats WHERE film_id IN ({', '.join(['%s'] * len(distances))})",
+                list(distances)
+            )
+            rental_counts = dict(cursor.fetchall())
+        matches = sorted((distance, -rental_counts.get(film_id, 0), film_id) for film_id, distance in distances.items())
+        if after is not None:
+            matches = [match for match in matches if match > tuple(after)]
+        chunks = list_chunks(matches[:fetch_count(limit)])
     
-    elif search_type == "genre":
-        sql = f"""
-        SELECT DISTINCT {columns}
-        FROM film f
-        JOIN film_category fc ON f.film_id = fc.film_id
-        JOIN category c ON fc.category_id = c.category_id
-        WHERE c.name LIKE %s
-        """
-        cursor.execute(sql, ('%' + query_param + '%', ))
+    elif search_type == "all":
+        # One round trip: each type's matches tagged with the type, merged
+        # and scored here. Only ids are ranked; rows are built per page.
+        parts = []
+        params = []
+        for match_type in search_all_weights:
+            match = film_match_sql(match_type, query_param, search_mode)
+            if match is not None:
+                parts.append(f"SELECT m.film_id, %s AS reason FROM ({match[0]}) m")
+                params += [match_type, *match[1]]
+        reasons = {}
+        if parts:
+            cursor.execute(" UNION ALL ".join(parts), params)
+            for film_id, reason in cursor.fetchall():
+                reasons.setdefault(film_id, []).append(reason)
+        matches = sorted(
+            ((sum(search_all_weights[reason] for reason in matched), film_id)
+             for film_id, matched in reasons.items()),
+            key=lambda match: (-match[0], match[1])
+        )
+        if after is not None:
+            matches = [match for match in matches if (-match[0], match[1]) > (-after[0], after[1])]
+        chunks = list_chunks(matches[:fetch_count(limit)])
+    
+    elif search_type in search_all_weights:
+        match = film_match_sql(search_type, query_param, search_mode)
+        chunks = []
+        if match is not None:
+            sql, params = f"SELECT m.film_id FROM ({match[0]}) m", list(match[1])
+            if after is not None:
+                sql += " WHERE m.film_id > %s"
+                params.append(after[0])
+            sql += " ORDER BY m.film_id"
+            sql += " LIMIT %s"
+            params.append(fetch_count(limit))
+            cursor.execute(sql, params)
+            chunks = cursor_chunks(cursor)
     
     else:
-        cursor.close()
-        conn.close()
         return jsonify([])
     
-    films = cursor.fetchall()
+    def render(matches):
+        film_ids = [match[-1] for match in matches]
+        films = catalog_films(film_ids) if stream is None else film_rows(catalog, dims, film_ids)
+        if ranked or fuzzy:
+            keys = {match[-1]: match for match in matches}
+            for film in films:
+                key = keys[film["film_id"]]
+                if search_type == "all":
+                    film["matched"] = sorted(reasons[film["film_id"]], key=lambda reason: -search_all_weights[reason])
+                    film["score"] = key[0]
+                elif fuzzy:
+                    film["distance"] = key[0]
+                    film["rental_count"] = -key[1]
+                else:
+                    film["relevance"] = key[0]
+        return films
+    
+    if stream is not None:
+        return stream_rows(render(matches) for matches in chunks)
+    
+    matches = [match for rows in chunks for match in rows]
+    next_cursor = encode_cursor(*matches[limit - 1]) if len(matches) > limit else None
+    films = render(matches[:limit])
     
-    for film in films:
-        for key, value in film.items():
-            film[key] = convert_data(value)
+    if not facets_requested:
+        return page_response(films, next_cursor)
     
-    cursor.close()
-    conn.close()
-    return jsonify(films)
+    # Facets cover every match, not just this page: one id-only query,
+    # then a single pass over the catalog.
+    if search_type == "all":
+        matched_ids = list(reasons)
+    else:
+        match = film_match_sql(search_type, query_param, search_mode)
+        matched_ids = []
+        if match is not None:
+            cursor.execute(*match)
+            matched_ids = [film_id for (film_id,) in cursor.fetchall()]
+    catalog = get_catalog()
+    matched = (catalog.get(film_id) for film_id in matched_ids)
+    facets = facet_counts([film for film in matched if film is not None],
+                          facet_length_buckets, facet_rental_rate_buckets, get_dimensions())
+    return page_response({"results": films, "facets": facets}, next_cursor)
+
 
 
 
+@app.route('/search/suggest', methods=['GET'])
+def search_suggest():
+  # Served from memory. Only the first build of a type reads MySQL on a
+  # request thread; later rebuilds run in the background.
+  search_type = request.args.get('type', 'film')
+  prefix = request.args.get('q', '')
+  limit = request.args.get('limit', suggest_limit, type=int)
+  if search_type not in suggestions.sources:
+    return jsonify({"error": "type must be one of " + ", ".join(suggestions.sources)}), 400
+  if not prefix.strip():
+    return jsonify([])
+  index = suggestions.index(search_type)
+  if index is None:
+    suggestions.refresh(search_type, get_db())
+    index = suggestions.index(search_type)
+  elif suggestions.needs_refresh(search_type):
+    schedule_suggestions_refresh(search_type)
+  return jsonify([
+    {"id": key, "name": name, "rental_count": score}
+    for key, name, score in index.complete(prefix, max(limit, 1))
+  ])
 
 @app.route('/rent_film', methods=['POST'])
 def rent_film():
@@ -282,8 +1144,8 @@ def rent_film():
   customer_id = data.get('customer_id')
   if not film_id or not customer_id:
     return jsonify({"error": "Missing film_id or customer_id"}), 400
-  conn = mysql.connector.connect(**db_config)
-  cursor = conn.cursor()
+  db = get_db()
+  cursor = db.cursor()
   query = """
     SELECT inventory_id 
     FROM inventory 
@@ -293,47 +1155,96 @@ def rent_film():
       )
     LIMIT 1;
   """
-  cursor.execute(query, (film_id,))
-  result = cursor.fetchone()
+  result = db.prepared_query(query, (film_id,))
   if not result:
-    cursor.close()
-    conn.close()
     return jsonify({"error": "Film not available for rent"}), 400
-  inventory_id = result[0]
+  inventory_id = result[0][0]
   insert_query = """
     INSERT INTO rental (rental_date, inventory_id, customer_id, staff_id)
     VALUES (NOW(), %s, %s, 1)
   """
   cursor.execute(insert_query, (inventory_id, customer_id))
-  conn.commit()
   rental_id = cursor.lastrowid
-  cursor.close()
-  conn.close()
+  cursor.execute(RENTAL_STATS_INCREMENT_SQL, (film_id,))
+  db.commit()
+  rentals_changed.send(app)
   return jsonify({"message": "Film rented successfully", "rental_id": rental_id})
 
 @app.route('/customers', methods=['GET'])
+@cached('customers')
 def get_customers():
-    conn = mysql.connector.connect(**db_config)
-    cursor = conn.cursor(dictionary=True)
+    # Keyset pages in customer_id, last_name or create_date order, with
+    # customer_id breaking ties; indexes in migrations/003 and 004.
+    sort = request.args.get('sort', 'customer_id')
+    if sort not in ("customer_id", "last_name", "create_date"):
+        return jsonify({"error": "sort must be customer_id, last_name or create_date"}), 400
+    limit = page_limit(customers_page_size, customers_max_page_size)
+    try:
+        if sort == "customer_id":
+            after = decode_cursor(request.args.get('cursor'), int)
+            if after is None and request.args.get('after_id') is not None:
+                after = [int(request.args['after_id'])]
+        else:
+            after = decode_cursor(request.args.get('cursor'), str, int)
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
+    
+    conditions = []
+    params = []
+    if request.args.get('store_id') is not None:
+        store_id = request.args.get('store_id', type=int)
+        if store_id not in get_dimensions().stores:
+            return jsonify({"error": "Unknown store_id"}), 400
+        conditions.append("store_id = %s")
+        params.append(store_id)
+    if request.args.get('active') is not None:
+        active = request.args.get('active', type=int)
+        if active not in (0, 1):
+            return jsonify({"error": "active must be 0 or 1"}), 400
+        conditions.append("active = %s")
+        params.append(active)
+    if after is not None and sort == "customer_id":
+        conditions.append("customer_id > %s")
+        params.append(after[0])
+    elif after is not None:
+        conditions.append(f"({sort} > %s OR ({sort} = %s AND customer_id > %s))")
+        params += [after[0], after[0], after[1]]
+    
+    db = get_db()
+    cursor = db.cursor(dictionary=True)
     
     query = """
     SELECT customer_id, store_id, first_name, last_name, email, address_id, active, create_date
     FROM customer
-    ORDER BY customer_id
     """
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    order = "customer_id" if sort == "customer_id" else f"{sort}, customer_id"
+    query += f" ORDER BY {order}"
+    query += " LIMIT %s"
+    params.append(fetch_count(limit))
     
-    cursor.execute(query)
+    cursor.execute(query, params)
+    if stream_format() is not None:
+        return stream_rows(cursor_chunks(cursor))
     customers = cursor.fetchall()
     
-    cursor.close()
-    conn.close()
+    next_cursor = None
+    if len(customers) > limit:
+        customers = customers[:limit]
+        last = customers[-1]
+        if sort == "customer_id":
+            next_cursor = encode_cursor(last["customer_id"])
+        else:
+            next_cursor = encode_cursor(convert_data(last[sort]), last["customer_id"])
     
-    return jsonify(customers)
+    return page_response(customers, next_cursor)
 
 
 
 
 @app.route('/customers/search', methods=['GET'])
+@cached('customers/search')
 def search_customers():
     search_type = request.args.get('type')
     query_param = request.args.get('query')
@@ -341,23 +1252,26 @@ def search_customers():
     if not search_type or not query_param:
         return jsonify([])
 
-    conn = mysql.connector.connect(**db_config)
-    cursor = conn.cursor(dictionary=True)
+    db = get_db()
+    cursor = db.cursor(dictionary=True)
 
     sql = ""
     if search_type == "customer_id":
         sql = "SELECT customer_id, first_name, last_name, email FROM customer WHERE customer_id = %s"
         cursor.execute(sql, (query_param,))
-    elif search_type == "first_name":
-        sql = "SELECT customer_id, first_name, last_name, email FROM customer WHERE first_name LIKE %s"
-        cursor.execute(sql, ('%' + query_param + '%',))
-    elif search_type == "last_name":
-        sql = "SELECT customer_id, first_name, last_name, email FROM customer WHERE last_name LIKE %s"
-        cursor.execute(sql, ('%' + query_param + '%',))
+    elif search_type in ("first_name", "last_name"):
+        # Names are matched in memory; MySQL only sees primary-key lookups
+        customer_ids = get_customer_names().search(search_type, query_param)
+        if not customer_ids:
+            return jsonify([])
+        sql = f"""
+        SELECT customer_id, first_name, last_name, email FROM customer
+        WHERE customer_id IN ({", ".join(["%s"] * len(customer_ids))})
+        ORDER BY customer_id
+        """
+        cursor.execute(sql, customer_ids)
 
     customers = cursor.fetchall()
-    cursor.close()
-    conn.close()
 
     return jsonify(customers)
 
@@ -373,22 +1287,20 @@ def add_customer():
     if not first_name or not last_name or not email or not store_id or not address_id:
         return jsonify({"error": "Missing required fields"}), 400
 
-    conn = mysql.connector.connect(**db_config)
-    cursor = conn.cursor(dictionary=True)
+    db = get_db()
+    cursor = db.cursor(dictionary=True)
 
     insert_query = """
     INSERT INTO customer (store_id, first_name, last_name, email, address_id, create_date)
     VALUES (%s, %s, %s, %s, %s, NOW())
     """
     cursor.execute(insert_query, (store_id, first_name, last_name, email, address_id))
-    conn.commit()
+    db.commit()
     new_customer_id = cursor.lastrowid
 
     cursor.execute("SELECT customer_id, store_id, first_name, last_name, email, address_id FROM customer WHERE customer_id = %s", (new_customer_id,))
     new_customer = cursor.fetchone()
-
-    cursor.close()
-    conn.close()
+    customers_changed.send(app, customer_id=new_customer_id, customer=new_customer)
 
     return jsonify(new_customer)
 
@@ -401,8 +1313,8 @@ def edit_customer(customer_id):
         if field not in data:
             return jsonify({"error": f"Missing field: {field}"}), 400
     
-    conn = mysql.connector.connect(**db_config)
-    cursor = conn.cursor()
+    db = get_db()
+    cursor = db.cursor()
 
     try:
         query = """
@@ -415,48 +1327,50 @@ def edit_customer(customer_id):
             data["address_id"], data["active"], customer_id
         ))
 
-        conn.commit()
-        cursor.close()
-        conn.close()
+        db.commit()
+        # rowcount is 0 for an unknown customer_id or an unchanged row
+        if cursor.rowcount:
+            # Index what MySQL stored, not the raw body
+            cursor = db.cursor(dictionary=True)
+            cursor.execute("SELECT customer_id, store_id, first_name, last_name, email, address_id FROM customer WHERE customer_id = %s", (customer_id,))
+            customers_changed.send(app, customer_id=customer_id, customer=cursor.fetchone())
 
         return jsonify({"message": "Customer updated successfully"}), 200
 
     except mysql.connector.Error as err:
-        conn.rollback()
-        cursor.close()
-        conn.close()
+        db.rollback()
         return jsonify({"error": str(err)}), 500
 
 
 @app.route('/delete_customer/<int:customer_id>', methods=['DELETE'])
 def delete_customer(customer_id):
-    conn = mysql.connector.connect(**db_config)
-    cursor = conn.cursor()
+    db = get_db()
+    cursor = db.cursor()
 
     try:
         cursor.execute("DELETE FROM payment WHERE customer_id = %s", (customer_id,))
 
+        cursor.execute(RENTAL_STATS_DECREMENT_CUSTOMER_SQL, (customer_id,))
+
         cursor.execute("DELETE FROM rental WHERE customer_id = %s", (customer_id,))
 
         cursor.execute("DELETE FROM customer WHERE customer_id = %s", (customer_id,))
 
-        conn.commit()
-        cursor.close()
-        conn.close()
+        db.commit()
+        customers_changed.send(app, customer_id=customer_id)
+        rentals_changed.send(app)
         return jsonify({"message": "Customer deleted successfully"}), 200
 
     except mysql.connector.Error as err:
-        conn.rollback() 
-        cursor.close()
-        conn.close()
+        db.rollback() 
         print(f"Error deleting customer: {str(err)}") 
         return jsonify({"error": f"Error deleting customer: {str(err)}"}), 500
 
 
 @app.route('/customer/<int:customer_id>/rental_history', methods=['GET'])
+@cached('rental_history')
 def get_customer_rental_history(customer_id):
-    conn = mysql.connector.connect(**db_config)
-    cursor = conn.cursor(dictionary=True)
+    db = get_db()
 
     query = """
     SELECT r.rental_id, f.title, r.rental_date, r.return_date
@@ -466,15 +1380,77 @@ def get_customer_rental_history(customer_id):
     WHERE r.customer_id = %s
     ORDER BY r.rental_date DESC
     """
-    cursor.execute(query, (customer_id,))
-    rental_history = cursor.fetchall()
-
-    cursor.close()
-    conn.close()
+    if stream_format() is not None:
+        cursor = db.cursor(dictionary=True)
+        cursor.execute(query + " LIMIT %s", (customer_id, page_limit(None, None)))
+        return stream_rows(cursor_chunks(cursor))
+    rental_history = db.prepared_query(query, (customer_id,), dictionary=True)
 
     return jsonify(rental_history)
 
 
 
+@app.cli.command("migrate")
+def migrate():
+  """Apply the SQL files in migrations/ in order."""
+  db = DBSession(pool)
+  counted = False
+  try:
+    cursor = db.cursor()
+    for name in sorted(os.listdir(MIGRATIONS_DIR)):
+      if not name.endswith(".sql"):
+        continue
+      path = os.path.join(MIGRATIONS_DIR, name)
+      # A new film_rental_stats is filled here; empty, it would leave
+      # /top_rented_films blank until rebuild-rental-stats was run.
+      creates_stats = False
+      if path == RENTAL_STATS_MIGRATION:
+        cursor.execute("SHOW TABLES LIKE 'film_rental_stats'")
+        creates_stats = not cursor.fetchall()
+      with open(path) as migration:
+        try:
+          cursor.execute(migration.read())
+        except mysql.connector.Error as err:
+          if err.errno not in MIGRATION_APPLIED_ERRNOS:
+            raise
+          print(f"{name}: already applied")
+          continue
+      print(f"{name}: applied")
+      if creates_stats:
+        cursor.execute(RENTAL_STATS_REBUILD_SQL)
+        db.commit()
+        counted = True
+        print(f"{name}: counted rentals for {cursor.rowcount} films")
+  finally:
+    db.close()
+  if counted:
+    rentals_changed.send(app)
+
+
+@app.cli.command("rebuild-rental-stats")
+def rebuild_rental_stats():
+  """Create film_rental_stats if needed and recount it from rental."""
+  db = DBSession(pool)
+  try:
+    cursor = db.cursor()
+    with open(RENTAL_STATS_MIGRATION) as migration:
+      cursor.execute(migration.read())
+    # Rows are replaced in one transaction, so readers see either the old
+    # or the rebuilt counts.
+    cursor.execute("DELETE FROM film_rental_stats")
+    cursor.execute(RENTAL_STATS_REBUILD_SQL)
+    rebuilt = cursor.rowcount
+    db.commit()
+  finally:
+    db.close()
+  rentals_changed.send(app)
+  print(f"Rebuilt film_rental_stats for {rebuilt} films")
+
+
 if __name__ == "__main__":
-  app.run(debug=True)
+  # With the reloader, this process only watches files and restarts a
+  # child (WERKZEUG_RUN_MAIN set) that serves; only the child warms up.
+  use_reloader = True
+  if not use_reloader or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+    start_warmup()
+  app.run(debug=True, use_reloader=use_reloader)
@@ -0,0 +1,88 @@
+import datetime
+import time
+
+import pytest
+
+import server
+from catalog import Dimensions, Film, FilmCatalog
+
+CUSTOMERS = [
+  {"customer_id": i, "store_id": 1, "first_name": "A", "last_name": "B", "email": "",
+   "address_id": 1, "active": 1, "create_date": datetime.datetime(2006, 2, 14)}
+  for i in range(1, 51)
+]
+
+
+class StubCursor:
+  def __init__(self):
+    self.rows = []
+
+  def execute(self, sql, params=()):
+    rows = list(CUSTOMERS) if "FROM customer" in sql else []
+    if "LIMIT %s" in sql:
+      rows = rows[:params[-1]]
+    self.rows = rows
+
+  def fetchall(self):
+    rows, self.rows = self.rows, []
+    return rows
+
+  def fetchmany(self, size):
+    rows, self.rows = self.rows[:size], self.rows[size:]
+    return rows
+
+
+class StubSession:
+  def cursor(self, **kwargs):
+    return StubCursor()
+
+  def close(self, error=None):
+    pass
+
+
+@pytest.fixture
+def client(monkeypatch):
+  monkeypatch.setattr(server, "get_db", lambda: server.g.setdefault("db", StubSession()))
+  return server.app.test_client()
+
+
+def film_row(film_id, title, **values):
+  row = {"film_id": film_id, "title": title, "description": "", "release_year": 2006, "language_id": 1,
+         "original_language_id": None, "rental_duration": 3, "rental_rate": 0.99, "length": 90,
+         "replacement_cost": 9.99, "rating": "PG", "special_features": "Trailers",
+         "last_update": datetime.datetime(2006, 2, 15)}
+  row.update(values)
+  return row
+
+
+FILMS = [
+  film_row(1, "ACADEMY DINOSAUR", length=86, rental_rate=0.99, rating="PG"),
+  film_row(2, "ACE GOLDFINGER", length=48, rental_rate=4.99, rating="G"),
+  film_row(3, "ADAPTATION HOLES", length=50, rental_rate=2.99, rating="NC-17"),
+  film_row(4, "AFFAIR PREJUDICE", length=117, rental_rate=2.99, rating="G", language_id=2),
+]
+FILM_CATEGORIES = {1: (6,), 2: (11,), 3: (6, 11), 4: ()}
+
+
+def load_catalog(monkeypatch, rows, film_categories):
+  # Loaded catalog and dimensions, so nothing needs the database
+  films = FilmCatalog(server.convert_data, refresh_interval=3600)
+  for row in rows:
+    film = Film(row, server.convert_data)
+    film.category_ids = film_categories[row["film_id"]]
+    films._films[film.film_id] = film
+  films.loaded, films._checked = True, time.monotonic()
+  dims = Dimensions(refresh_interval=3600)
+  dims.categories = {6: "Documentary", 11: "Horror"}
+  dims.languages = {1: "English", 2: "Italian"}
+  dims.stores = {1: {}, 2: {}}
+  dims.loaded, dims._checked = True, time.monotonic()
+  monkeypatch.setattr(server, "film_catalog", films)
+  monkeypatch.setattr(server, "dimensions", dims)
+  monkeypatch.setattr(server, "title_index", (None, None))
+  return films
+
+
+@pytest.fixture
+def catalog(monkeypatch):
+  return load_catalog(monkeypatch, FILMS, FILM_CATEGORIES)
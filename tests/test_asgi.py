@@ -0,0 +1,163 @@
+import asyncio
+import json
+
+import pytest
+
+import asgi_server
+import server
+from conftest import CUSTOMERS
+
+
+class AsyncStubCursor:
+  def __init__(self):
+    self.rows = []
+
+  async def execute(self, sql, params=()):
+    if "FROM store" in sql:
+      rows = [(1,)] if params[0] == 1 else []
+    elif "FROM rental" in sql:
+      rows = [{"rental_id": i, "title": "ACADEMY DINOSAUR", "rental_date": None, "return_date": None}
+              for i in range(1, 31)][:params[-1]]
+    else:
+      rows = [dict(row) for row in CUSTOMERS if "customer_id > %s" not in sql or row["customer_id"] > params[-2]]
+      if "LIMIT %s" in sql:
+        rows = rows[:params[-1]]
+    self.rows = rows
+
+  async def fetchall(self):
+    rows, self.rows = self.rows, []
+    return rows
+
+  async def fetchmany(self, size):
+    rows, self.rows = self.rows[:size], self.rows[size:]
+    return rows
+
+
+class AsyncStubConnection:
+  async def cursor(self, **kwargs):
+    return AsyncStubCursor()
+
+
+class AsyncStubPool:
+  async def get_connection(self):
+    return AsyncStubConnection()
+
+  async def release(self, conn):
+    pass
+
+  async def ping(self):
+    return "ok"
+
+
+@pytest.fixture(autouse=True)
+def stub_pool(monkeypatch):
+  monkeypatch.setattr(asgi_server, "pool", AsyncStubPool())
+
+
+def get(path, query_string=b""):
+  messages = []
+
+  async def receive():
+    return {"type": "http.request", "body": b""}
+
+  async def send(message):
+    messages.append(message)
+
+  scope = {"type": "http", "method": "GET", "path": path, "query_string": query_string, "headers": []}
+  asyncio.run(asgi_server.app(scope, receive, send))
+  start = messages[0]
+  headers = {name.decode(): value.decode() for name, value in start["headers"]}
+  return start["status"], headers, b"".join(message.get("body", b"") for message in messages[1:])
+
+
+def test_customers_are_paged_with_next_cursor():
+  status, headers, body = get("/customers", b"limit=10")
+  assert status == 200
+  assert [row["customer_id"] for row in json.loads(body)] == list(range(1, 11))
+  status, headers, body = get("/customers", f"limit=10&cursor={headers['x-next-cursor']}".encode())
+  assert [row["customer_id"] for row in json.loads(body)] == list(range(11, 21))
+
+
+def test_customers_stream_as_ndjson():
+  status, headers, body = get("/customers", b"stream=ndjson&limit=7")
+  assert headers["content-type"] == "application/x-ndjson"
+  assert "content-length" not in headers
+  assert len(body.splitlines()) == 7
+
+
+def test_customers_reject_unknown_store():
+  status, headers, body = get("/customers", b"store_id=9")
+  assert status == 400
+
+
+def test_suggest_runs_the_flask_view(monkeypatch):
+  monkeypatch.setattr(server.suggestions, "sources", {"film": None})
+  status, headers, body = get("/search/suggest", b"type=actor&q=a")
+  assert status == 400
+  assert json.loads(body) == {"error": "type must be one of film"}
+
+
+def test_customers_stream_is_capped(monkeypatch):
+  monkeypatch.setattr(asgi_server, "stream_max_rows", 12)
+  status, headers, body = get("/customers", b"stream=ndjson")
+  assert len(body.splitlines()) == 12
+
+
+def test_concurrent_streams_are_capped(monkeypatch):
+  monkeypatch.setattr(asgi_server, "stream_slots", asyncio.Semaphore(0))
+  status, headers, body = get("/customers", b"stream=ndjson")
+  assert status == 503
+
+
+def test_finished_stream_gives_back_its_slot(monkeypatch):
+  monkeypatch.setattr(asgi_server, "stream_slots", asyncio.Semaphore(1))
+  assert get("/customers", b"stream=json")[0] == 200
+  assert get("/customers", b"stream=json")[0] == 200
+
+
+class RentalStatsCursor:
+  def execute(self, sql, params=()):
+    pass
+
+  def fetchall(self):
+    return [(3, 9), (1, 4)]
+
+
+class RentalStatsSession:
+  def cursor(self, **kwargs):
+    return RentalStatsCursor()
+
+  def close(self, error=None):
+    pass
+
+
+def test_top_rented_films_have_the_same_keys_in_both_editions(catalog, monkeypatch):
+  monkeypatch.setattr(server, "get_db", lambda: server.g.setdefault("db", RentalStatsSession()))
+  server.response_cache.clear()
+  flask_rows = server.app.test_client().get("/top_rented_films").json
+  server.response_cache.clear()
+  status, headers, body = get("/top_rented_films")
+  asgi_rows = json.loads(body)
+  assert [row["film_id"] for row in asgi_rows] == [3, 1]
+  assert [sorted(row) for row in asgi_rows] == [sorted(row) for row in flask_rows]
+  assert {"language", "categories", "rental_count"} <= set(asgi_rows[0])
+
+
+def test_rental_history_streams_as_ndjson():
+  status, headers, body = get("/customer/1/rental_history", b"stream=ndjson&limit=25")
+  assert headers["content-type"] == "application/x-ndjson"
+  assert [json.loads(line)["rental_id"] for line in body.splitlines()] == list(range(1, 26))
+
+
+def test_health_reports_the_pool():
+  status, headers, body = get("/health")
+  assert status == 200
+  assert json.loads(body) == {"status": "ok", "pool": "ok"}
+
+
+def test_ready_follows_warmup(monkeypatch):
+  monkeypatch.setattr(asgi_server, "start_warmup", lambda: None)
+  monkeypatch.setitem(server.warmup_state, "ready", False)
+  assert get("/ready")[0] == 503
+  monkeypatch.setitem(server.warmup_state, "ready", True)
+  assert get("/ready")[0] == 200
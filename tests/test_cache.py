@@ -0,0 +1,182 @@
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+from cache import CachedResponse, ResponseCache, SharedCache, SingleFlight
+
+
+def response(body=b"[]", generation=0, fresh_until=None):
+  return CachedResponse(body, "application/json", "etag", datetime(2026, 1, 1, tzinfo=timezone.utc),
+                        "public, max-age=60", generation=generation, fresh_until=fresh_until,
+                        extra_headers=[("X-Next-Cursor", "abc")])
+
+
+@pytest.fixture(params=["memory", "shared"])
+def cache(request, tmp_path):
+  if request.param == "memory":
+    return ResponseCache(maxsize=3)
+  return SharedCache(os.path.join(tmp_path, "cache", "responses.db"), maxsize=3)
+
+
+def key(route, n=0):
+  return (route, (), (("n", str(n)),))
+
+
+def test_set_then_get(cache):
+  cache.set(key("top_actors"), response(b"[1]"))
+  entry = cache.get(key("top_actors"))
+  assert entry.body == b"[1]"
+  assert ("X-Next-Cursor", "abc") in entry.headers
+  assert cache.stats()["hits"] == 1
+
+
+def test_set_for_a_stale_generation_is_dropped(cache):
+  generation = cache.generation("top_actors")
+  cache.invalidate("top_actors")
+  cache.set(key("top_actors"), response(generation=generation), generation=generation)
+  assert cache.get(key("top_actors")) is None
+  cache.set(key("top_actors"), response(), generation=cache.generation("top_actors"))
+  assert cache.get(key("top_actors")) is not None
+
+
+def test_invalidate_drops_only_its_routes(cache):
+  cache.set(key("top_actors"), response())
+  cache.set(key("customers"), response())
+  cache.invalidate("top_actors")
+  assert cache.get(key("top_actors")) is None
+  assert cache.get(key("customers")) is not None
+  assert cache.version("top_actors")[0] == 1
+
+
+def test_invalidate_without_drop_keeps_entries(cache):
+  cache.set(key("top_actors"), response())
+  cache.invalidate("top_actors", drop=False)
+  assert cache.get(key("top_actors")) is not None
+  assert cache.generation("top_actors") == 1
+
+
+def test_expired_entries_are_misses(cache):
+  cache.set(key("top_actors"), response(), ttl=0.01)
+  time.sleep(0.02)
+  assert cache.get(key("top_actors")) is None
+
+
+def test_memory_cache_evicts_least_recently_used():
+  cache = ResponseCache(maxsize=3)
+  for n in range(3):
+    cache.set(key("customers", n), response())
+  cache.get(key("customers", 0))
+  cache.set(key("customers", 3), response())
+  assert cache.get(key("customers", 1)) is None
+  assert all(cache.get(key("customers", n)) is not None for n in (0, 2, 3))
+  assert cache.stats()["evictions"] == 1
+
+
+def test_shared_cache_evicts_closest_to_expiring(tmp_path):
+  cache = SharedCache(os.path.join(tmp_path, "cache", "responses.db"), maxsize=3)
+  for n, ttl in enumerate((30, 10, 20, 40)):
+    cache.set(key("customers", n), response(), ttl=ttl)
+  assert cache.get(key("customers", 1)) is None
+  assert cache.stats()["size"] == 3
+
+
+def test_shared_cache_is_shared_between_instances(tmp_path):
+  path = os.path.join(tmp_path, "cache", "responses.db")
+  first, second = SharedCache(path), SharedCache(path)
+  first.set(key("top_actors"), response(b"[2]"))
+  assert second.get(key("top_actors")).body == b"[2]"
+  second.invalidate("top_actors")
+  assert first.get(key("top_actors")) is None
+  assert first.generation("top_actors") == 1
+
+
+def test_shared_cache_refuses_a_writable_directory(tmp_path):
+  directory = os.path.join(tmp_path, "open")
+  os.makedirs(directory)
+  os.chmod(directory, 0o777)
+  with pytest.raises(RuntimeError):
+    SharedCache(os.path.join(directory, "responses.db"))
+
+
+def test_shared_cache_start_is_per_process(tmp_path):
+  path = os.path.join(tmp_path, "cache", "responses.db")
+  SharedCache(path)
+  time.sleep(0.01)
+  started = time.time()
+  assert SharedCache(path).version("top_actors")[1] >= started
+
+
+def start_leader(flight, key, release, value="value"):
+  # Runs a leader that blocks until release is set
+  results = []
+  def fn():
+    release.wait(5)
+    if isinstance(value, Exception):
+      raise value
+    return value
+  def run():
+    try:
+      results.append(flight.do(key, fn, 5))
+    except Exception as err:
+      results.append(err)
+  thread = threading.Thread(target=run)
+  thread.start()
+  while flight.stats()["in_flight"] == 0:
+    time.sleep(0.001)
+  return thread, results
+
+
+def test_followers_share_the_leaders_value():
+  flight, release = SingleFlight(), threading.Event()
+  leader, results = start_leader(flight, "k", release)
+  follower_results = []
+  follower = threading.Thread(target=lambda: follower_results.append(flight.do("k", lambda: "own", 5)))
+  follower.start()
+  while flight.stats()["followers"] == 0:
+    time.sleep(0.001)
+  release.set()
+  leader.join()
+  follower.join()
+  assert results == ["value"] and follower_results == ["value"]
+  assert flight.stats() == {"leaders": 1, "followers": 1, "follower_timeouts": 0,
+                            "follower_fallbacks": 0, "in_flight": 0}
+
+
+def test_follower_that_times_out_runs_its_own_call():
+  flight, release = SingleFlight(), threading.Event()
+  leader, results = start_leader(flight, "k", release)
+  assert flight.do("k", lambda: "own", 0.01) == "own"
+  release.set()
+  leader.join()
+  assert flight.stats()["follower_timeouts"] == 1
+
+
+def test_follower_falls_back_when_the_leader_fails():
+  flight, release = SingleFlight(), threading.Event()
+  leader, results = start_leader(flight, "k", release, value=ValueError("boom"))
+  threading.Timer(0.2, release.set).start()
+  assert flight.do("k", lambda: "own", 5) == "own"
+  leader.join()
+  assert isinstance(results[0], ValueError)
+  assert flight.stats()["follower_fallbacks"] == 1
+
+
+def test_follower_falls_back_on_an_unshareable_value():
+  flight, release = SingleFlight(), threading.Event()
+  leader, results = start_leader(flight, "k", release, value="private")
+  threading.Timer(0.2, release.set).start()
+  assert flight.do("k", lambda: "own", 5, shareable=lambda value: value != "private") == "own"
+  leader.join()
+  assert flight.stats()["follower_fallbacks"] == 1
+
+
+def test_different_keys_do_not_wait_on_each_other():
+  flight, release = SingleFlight(), threading.Event()
+  leader, results = start_leader(flight, "k", release)
+  assert flight.do("other", lambda: "own", 5) == "own"
+  release.set()
+  leader.join()
+  assert flight.stats()["leaders"] == 2
@@ -0,0 +1,47 @@
+import server
+from catalog import Film, bucket_labels, facet_counts
+from conftest import film_row
+
+
+def test_bucket_labels():
+  assert bucket_labels((60, 90, 120)) == ["<60", "60-90", "90-120", "120+"]
+  assert bucket_labels((0.99, 2.5)) == ["<0.99", "0.99-2.5", "2.5+"]
+  assert bucket_labels((1,)) == ["<1", "1+"]
+
+
+def test_facet_counts_by_id(catalog):
+  facets = facet_counts(catalog.films(), (60, 90, 120, 150), (1, 3))
+  assert facets == {
+    "rating": {"PG": 1, "G": 2, "NC-17": 1},
+    "category": {6: 2, 11: 2},
+    "language": {1: 3, 2: 1},
+    "length": {"60-90": 1, "<60": 2, "90-120": 1},
+    "rental_rate": {"<1": 1, "3+": 1, "1-3": 2},
+  }
+
+
+def test_facet_counts_names_categories_and_languages(catalog):
+  facets = facet_counts(catalog.films(), (60, 90, 120, 150), (1, 3), server.dimensions)
+  assert facets["category"] == {"Documentary": 2, "Horror": 2}
+  assert facets["language"] == {"English": 3, "Italian": 1}
+
+
+def test_facet_counts_edges_open_the_next_bucket():
+  films = [Film(film_row(1, "A", length=90, rental_rate=3), server.convert_data),
+           Film(film_row(2, "B", length=150, rental_rate=0.99), server.convert_data)]
+  facets = facet_counts(films, (60, 90, 120, 150), (1, 3))
+  assert facets["length"] == {"90-120": 1, "150+": 1}
+  assert facets["rental_rate"] == {"3+": 1, "<1": 1}
+
+
+def test_facet_counts_skip_unknown_length(catalog):
+  film = Film(film_row(1, "A", length=None, language_id=3), server.convert_data)
+  facets = facet_counts([film], (60, 90, 120, 150), (1, 3), server.dimensions)
+  assert facets["length"] == {}
+  assert facets["rating"] == {"PG": 1}
+  # A language missing from the dimensions keeps its id
+  assert facets["language"] == {3: 1}
+
+
+def test_facet_counts_of_no_films():
+  assert facet_counts([], (60,), (1,)) == {name: {} for name in ("rating", "category", "language", "length", "rental_rate")}
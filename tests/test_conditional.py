@@ -0,0 +1,51 @@
+import pytest
+
+import server
+from conftest import CUSTOMERS
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+  server.response_cache.clear()
+  yield
+  server.response_cache.clear()
+
+
+def test_expired_entry_is_not_revalidated_by_generation(client, monkeypatch):
+  # Another worker's write leaves this worker's generation unchanged
+  etag = client.get("/customers?limit=5").headers["ETag"]
+  server.response_cache.clear()
+  monkeypatch.setitem(CUSTOMERS[0], "last_name", "C")
+  response = client.get("/customers?limit=5", headers={"If-None-Match": etag})
+  assert response.status_code == 200
+  assert response.json[0]["last_name"] == "C"
+
+
+def test_miss_answers_304_when_body_matches(client):
+  etag = client.get("/customers?limit=5").headers["ETag"]
+  server.response_cache.clear()
+  response = client.get("/customers?limit=5", headers={"If-None-Match": etag})
+  assert response.status_code == 304
+
+
+def test_if_modified_since_is_answered_from_a_cache_hit(client):
+  last_modified = client.get("/customers?limit=5").headers["Last-Modified"]
+  response = client.get("/customers?limit=5", headers={"If-Modified-Since": last_modified})
+  assert response.status_code == 304
+
+
+def test_if_modified_since_never_answers_a_miss(client):
+  last_modified = client.get("/customers?limit=5").headers["Last-Modified"]
+  server.response_cache.clear()
+  response = client.get("/customers?limit=5", headers={"If-Modified-Since": last_modified})
+  assert response.status_code == 200
+
+
+def test_entry_rendered_after_the_clients_copy_is_sent(client, monkeypatch):
+  # The route was never invalidated, but the entry expired and was rebuilt
+  client.get("/customers?limit=5")
+  server.response_cache.clear()
+  monkeypatch.setattr(server.time, "time", lambda: 2000000000.0)
+  client.get("/customers?limit=5")
+  response = client.get("/customers?limit=5", headers={"If-Modified-Since": "Wed, 18 May 2033 03:33:19 GMT"})
+  assert response.status_code == 200
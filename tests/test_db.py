@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+from mysql.connector import errors
+
+from db import AsyncConnectionPool, ConnectionPool
+
+
+class FakeConnection:
+  def close(self):
+    pass
+
+
+class FakePool:
+  def __init__(self, error=None):
+    self.error = error
+    self.checkouts = 0
+
+  def get_connection(self):
+    self.checkouts += 1
+    if self.error is not None:
+      raise self.error
+    return FakeConnection()
+
+
+def test_ping_does_not_build_the_pool():
+  pool = ConnectionPool({})
+  assert pool.ping() == "idle"
+  assert pool._pool is None
+
+
+def test_ping_does_not_wait_for_a_slot():
+  pool = ConnectionPool({}, pool_size=1, max_overflow=0, pool_timeout=30)
+  pool._pool = FakePool()
+  pool._slots.acquire()
+  assert pool.ping() == "busy"
+  assert pool._pool.checkouts == 0
+
+
+def test_ping_never_opens_an_overflow_connection():
+  pool = ConnectionPool({})
+  pool._pool = FakePool(errors.PoolError("exhausted"))
+  assert pool.ping() == "busy"
+
+
+def test_ping_checks_a_free_connection():
+  pool = ConnectionPool({})
+  pool._pool = FakePool()
+  assert pool.ping() == "ok"
+  assert pool._pool.checkouts == 1
+  assert pool._slots.acquire(blocking=False)
+
+
+def test_failed_ping_is_raised_and_counted():
+  pool = ConnectionPool({})
+  pool._pool = FakePool(errors.InterfaceError("gone"))
+  with pytest.raises(errors.InterfaceError):
+    pool.ping()
+  assert pool.stats()["health_check_failures"] == 1
+
+
+class FakeAsyncConnection:
+  def __init__(self, connected=True):
+    self.connected = connected
+
+  async def is_connected(self):
+    return self.connected
+
+
+def test_async_ping_does_not_connect_before_first_checkout():
+  assert asyncio.run(AsyncConnectionPool({}).ping()) == "idle"
+
+
+def test_async_ping_does_not_wait_for_a_slot():
+  async def ping():
+    pool = AsyncConnectionPool({}, pool_size=1)
+    await pool._slots.acquire()
+    return await pool.ping()
+  assert asyncio.run(ping()) == "busy"
+
+
+def test_async_ping_checks_an_idle_connection():
+  pool = AsyncConnectionPool({})
+  cnx = FakeAsyncConnection()
+  pool._idle.append(cnx)
+  assert asyncio.run(pool.ping()) == "ok"
+  assert pool._idle == [cnx]
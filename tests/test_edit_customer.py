@@ -0,0 +1,72 @@
+import pytest
+
+import server
+
+BODY = {"store_id": 1, "first_name": 7, "last_name": "SMITH", "email": "", "address_id": 1, "active": 1}
+
+
+class EditCursor:
+  def __init__(self, stored):
+    self.stored = stored
+    self.rowcount = 0
+
+  def execute(self, sql, params=()):
+    if sql.lstrip().startswith("UPDATE"):
+      self.rowcount = int(self.stored is not None)
+    else:
+      self.row = self.stored
+
+  def fetchone(self):
+    return self.row
+
+
+class EditSession:
+  def __init__(self, stored):
+    self.stored = stored
+
+  def cursor(self, **kwargs):
+    return EditCursor(self.stored)
+
+  def commit(self):
+    pass
+
+  def close(self, error=None):
+    pass
+
+
+class RecordingSignal:
+  def __init__(self):
+    self.sent = []
+
+  def send(self, sender, **extra):
+    self.sent.append(extra)
+
+
+@pytest.fixture
+def signals(monkeypatch):
+  signal = RecordingSignal()
+  monkeypatch.setattr(server, "customers_changed", signal)
+  return signal.sent
+
+
+def edit(monkeypatch, stored):
+  monkeypatch.setattr(server, "get_db", lambda: server.g.setdefault("db", EditSession(stored)))
+  return server.app.test_client().put("/edit_customer/5", json=BODY)
+
+
+def test_edit_indexes_stored_row(monkeypatch, signals):
+  stored = {"customer_id": 5, "first_name": "7", "last_name": "SMITH"}
+  assert edit(monkeypatch, stored).status_code == 200
+  assert signals == [{"customer_id": 5, "customer": stored}]
+
+
+def test_edit_of_unknown_customer_sends_nothing(monkeypatch, signals):
+  assert edit(monkeypatch, None).status_code == 200
+  assert signals == []
+
+
+def test_name_index_add_accepts_empty_names():
+  index = server.NameIndex("customer", "customer_id", {"first_name": "first_name"})
+  index.loaded = True
+  index.add(5, {"first_name": None})
+  assert index.search("first_name", "") == [5]
@@ -0,0 +1,54 @@
+import server
+
+
+class MigrateCursor:
+  def __init__(self, tables, executed):
+    self.tables = tables
+    self.executed = executed
+    self.rowcount = 0
+
+  def execute(self, sql, params=()):
+    self.executed.append(sql)
+    if sql.startswith("SHOW TABLES"):
+      self.rows = [("film_rental_stats",)] if "film_rental_stats" in self.tables else []
+    elif "CREATE TABLE IF NOT EXISTS film_rental_stats" in sql:
+      self.tables.add("film_rental_stats")
+    elif sql == server.RENTAL_STATS_REBUILD_SQL:
+      self.rowcount = 1000
+
+  def fetchall(self):
+    return self.rows
+
+
+class MigrateSession:
+  def __init__(self, tables, executed):
+    self.tables = tables
+    self.executed = executed
+
+  def cursor(self, **kwargs):
+    return MigrateCursor(self.tables, self.executed)
+
+  def commit(self):
+    pass
+
+  def close(self, error=None):
+    pass
+
+
+def migrate(monkeypatch, tables):
+  executed = []
+  monkeypatch.setattr(server, "DBSession", lambda pool: MigrateSession(tables, executed))
+  result = server.app.test_cli_runner().invoke(args=["migrate"])
+  assert result.exit_code == 0, result.output
+  return executed
+
+
+def test_migrate_fills_a_new_rental_stats_table(monkeypatch):
+  executed = migrate(monkeypatch, set())
+  assert executed.count(server.RENTAL_STATS_REBUILD_SQL) == 1
+
+
+def test_migrate_leaves_existing_rental_stats_alone(monkeypatch):
+  executed = migrate(monkeypatch, {"film_rental_stats"})
+  assert server.RENTAL_STATS_REBUILD_SQL not in executed
+
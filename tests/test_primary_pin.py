@@ -0,0 +1,69 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import server
+from conftest import StubSession
+
+
+@pytest.fixture
+def pools(monkeypatch):
+  used = []
+  primary, replica = object(), object()
+  monkeypatch.setattr(server, "pool", primary)
+  monkeypatch.setattr(server, "replica_pool", replica)
+
+  def get_db():
+    if "db" not in server.g:
+      used.append("primary" if server.pool_for_request() is primary else "replica")
+      server.g.db = StubSession()
+    return server.g.db
+  monkeypatch.setattr(server, "get_db", get_db)
+  monkeypatch.setattr(server.response_cache, "_started", time.time() - 60)
+  monkeypatch.setattr(server.response_cache, "_modified", {})
+  server.response_cache.clear()
+  yield used
+  server.response_cache.clear()
+
+
+def test_pinned_request_bypasses_cache(pools):
+  client = server.app.test_client()
+  client.get("/customers?limit=5")
+  client.set_cookie(server.PRIMARY_PIN_COOKIE, str(time.time() + server.read_your_writes_window / 2))
+  client.get("/customers?limit=5")
+  assert pools == ["replica", "primary"]
+
+
+def test_render_after_recent_invalidation_reads_primary(pools):
+  client = server.app.test_client()
+  server.response_cache.invalidate("customers")
+  client.get("/customers?limit=5")
+  assert pools == ["primary"]
+
+
+def test_revalidate_reads_primary(pools):
+  view = server.get_customers.__wrapped__
+  server.revalidate("customers", ("customers", (), ()), view, {}, "/customers", "limit=5")
+  assert pools == ["primary"]
+
+
+def test_stale_entry_is_refreshed_in_background(pools, monkeypatch):
+  monkeypatch.setitem(server.swr_policies, "customers", (0, 60))
+  executor = ThreadPoolExecutor(max_workers=1)
+  monkeypatch.setattr(server, "swr_executor", executor)
+  client = server.app.test_client()
+  client.get("/customers?limit=5")
+  errors = server.swr_stats["refresh_errors"]
+  client.get("/customers?limit=5")
+  executor.shutdown(wait=True)
+  assert server.swr_stats["refresh_errors"] == errors
+  assert pools == ["replica", "primary"]
+
+
+def test_forged_far_future_pin_is_ignored(pools):
+  client = server.app.test_client()
+  client.get("/customers?limit=5")
+  client.set_cookie(server.PRIMARY_PIN_COOKIE, "9e18")
+  client.get("/customers?limit=5")
+  assert pools == ["replica"]
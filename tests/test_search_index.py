@@ -0,0 +1,121 @@
+from search_index import FuzzyIndex, NameIndex, PrefixIndex, Suggestions, TrigramIndex
+
+TITLES = [(1, "ACADEMY DINOSAUR"), (2, "ACE GOLDFINGER"), (3, "DINOSAUR SECRETARY"), (4, "ADAPTATION HOLES")]
+
+
+def trigram_index():
+  index = TrigramIndex()
+  for key, value in TITLES:
+    index.add(key, value)
+  return index
+
+
+def test_trigram_finds_substrings_ignoring_case():
+  index = trigram_index()
+  assert index.search("dinosaur") == [1, 3]
+  assert index.search("SAUR SEC") == [3]
+  assert index.search("goldfinger!") == []
+
+
+def test_trigram_checks_candidates_against_values():
+  # "ABAB" holds both trigrams of "ababab" but not the string itself
+  index = trigram_index()
+  index.add(5, "ABAB")
+  assert index.search("ababab") == []
+  assert index.search("bab") == [5]
+
+
+def test_trigram_short_queries_scan_values():
+  index = trigram_index()
+  assert index.search("ac") == [1, 2]
+  assert index.search("") == [1, 2, 3, 4]
+
+
+def test_trigram_add_replaces_and_remove_forgets():
+  index = trigram_index()
+  index.add(1, "ACADEMY PARTY")
+  assert index.search("dinosaur") == [3]
+  assert index.search("party") == [1]
+  index.remove(3)
+  index.remove(99)
+  assert index.search("dinosaur") == []
+  assert len(index) == 3
+  assert "din" not in index._postings
+
+
+def test_name_index_add_waits_for_first_load():
+  names = NameIndex("actor", "actor_id", {"name": "name"})
+  names.add(1, {"name": "PENELOPE GUINESS"})
+  assert names.search("name", "guin") == []
+  names.loaded = True
+  names.add(1, {"name": "PENELOPE GUINESS"})
+  names.add(2, {"name": None})
+  assert names.search("name", "guin") == [1]
+  names.remove(1)
+  assert names.search("name", "guin") == []
+
+
+def test_fuzzy_matches_whole_title_with_typo():
+  assert FuzzyIndex(TITLES).search("ACADEMY DINOSOUR", 2) == [(1, 1)]
+
+
+def test_fuzzy_matches_one_word_of_title():
+  assert FuzzyIndex(TITLES).search("DINOSAUR", 2) == [(0, 1), (0, 3)]
+  assert FuzzyIndex(TITLES).search("academy", 1) == [(0, 1)]
+
+
+def test_fuzzy_matches_misspelled_word_of_title():
+  assert FuzzyIndex(TITLES).search("dinosoar", 2) == [(2, 1), (2, 3)]
+
+
+def test_fuzzy_matches_exact_substring():
+  assert FuzzyIndex(TITLES).search("goldfin", 1) == [(0, 2)]
+
+
+ACTORS = [(1, "PENELOPE GUINESS", 3), (2, "NICK WAHLBERG", 7), (3, "ED CHASE", 3),
+          (4, "ELLEN DAVIS", 3), (5, "GUINESS PENN", 1), (6, "Nick Stallone", 7), (7, "EMILY DEE", 5)]
+
+
+def test_prefix_completes_any_word_of_a_name():
+  index = PrefixIndex(ACTORS)
+  assert index.complete("gui") == [(1, "PENELOPE GUINESS", 3), (5, "GUINESS PENN", 1)]
+  assert index.complete("  Penelope   GUI ") == [(1, "PENELOPE GUINESS", 3)]
+  assert index.complete("guinness") == []
+
+
+def test_prefix_ranks_by_score_then_name():
+  index = PrefixIndex(ACTORS)
+  assert [key for key, name, score in index.complete("n")] == [2, 6]
+  assert [key for key, name, score in index.complete("e")] == [7, 3, 4]
+
+
+def test_prefix_limit_is_capped_by_index_limit():
+  index = PrefixIndex(ACTORS, limit=2)
+  assert [key for key, name, score in index.complete("e", 1)] == [7]
+  assert len(index.complete("e", 10)) == 2
+  assert len(index.complete("pen", 10)) == 2
+
+
+def test_prefix_precomputed_tops_match_ranking():
+  index = PrefixIndex(ACTORS)
+  assert index._top
+  for prefix, top in index._top.items():
+    assert top == index._rank(prefix, index.limit)
+
+
+def test_prefix_empty_query_completes_nothing():
+  index = PrefixIndex(ACTORS)
+  assert index.complete("") == []
+  assert index.complete("   ") == []
+  assert len(index) == 7
+
+
+def test_suggestions_expire_during_rebuild_is_kept():
+  names = [(1, "PENELOPE GUINESS", 3)]
+
+  def source(db):
+    suggestions.expire("actor")
+    return list(names)
+  suggestions = Suggestions({"actor": source})
+  suggestions.refresh("actor", None)
+  assert suggestions.needs_refresh("actor")
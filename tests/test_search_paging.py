@@ -0,0 +1,146 @@
+import base64
+import json
+import sqlite3
+
+import pytest
+
+import server
+from conftest import film_row, load_catalog
+from search_index import NameIndex
+
+# Enough films with repeated words that relevance, scores and fuzzy
+# distances tie across page boundaries
+WORDS = ["DINOSAUR", "DINOSOAR", "HORROR", "ACADEMY"]
+FILMS = [
+  film_row(film_id, f"{WORDS[film_id % 4]} {WORDS[film_id % 3]} {film_id}",
+           description=" ".join(WORDS[:film_id % 4]))
+  for film_id in range(1, 31)
+]
+FILM_CATEGORIES = {film_id: (6,) if film_id % 2 else (6, 11) for film_id in range(1, 31)}
+FILM_ACTORS = [(film_id % 3 + 1, film_id) for film_id in range(1, 31)] + [(4, film_id) for film_id in range(1, 31, 2)]
+ACTORS = {1: "PENELOPE DINOSAUR", 2: "NICK WAHLBERG", 3: "ED DINOSAUR", 4: "JENNIFER HORROR"}
+
+
+def relevance(title, description, query):
+  # Stand-in for MATCH ... AGAINST: how many of the query's words appear
+  words = f"{title} {description}".casefold().split()
+  return float(sum(words.count(word) for word in query.casefold().split()))
+
+
+class SqliteCursor:
+  def __init__(self, connection):
+    self.cursor = connection.cursor()
+
+  def execute(self, sql, params=()):
+    sql = sql.replace("MATCH(f.title, f.description) AGAINST (%s)", "relevance(f.title, f.description, %s)")
+    # MySQL takes HAVING on an ungrouped query; SQLite needs a GROUP BY,
+    # and grouping by the primary key changes nothing
+    sql = sql.replace(" HAVING ", " GROUP BY f.film_id HAVING ")
+    self.cursor.execute(sql.replace("%s", "?"), list(params))
+
+  def fetchall(self):
+    return self.cursor.fetchall()
+
+  def fetchmany(self, size):
+    return self.cursor.fetchmany(size)
+
+
+class SqliteSession:
+  def __init__(self):
+    self.connection = sqlite3.connect(":memory:", check_same_thread=False)
+    self.connection.create_function("relevance", 3, relevance)
+    self.connection.executescript("""
+      CREATE TABLE film (film_id INTEGER PRIMARY KEY, title TEXT, description TEXT);
+      CREATE TABLE film_actor (actor_id INTEGER, film_id INTEGER);
+      CREATE TABLE film_category (film_id INTEGER, category_id INTEGER);
+      CREATE TABLE film_rental_stats (film_id INTEGER PRIMARY KEY, rental_count INTEGER);
+    """)
+    self.connection.executemany("INSERT INTO film VALUES (?, ?, ?)",
+                                [(row["film_id"], row["title"], row["description"]) for row in FILMS])
+    self.connection.executemany("INSERT INTO film_actor VALUES (?, ?)", FILM_ACTORS)
+    self.connection.executemany("INSERT INTO film_category VALUES (?, ?)",
+                                [(film_id, category_id) for film_id, categories in FILM_CATEGORIES.items()
+                                 for category_id in categories])
+    self.connection.executemany("INSERT INTO film_rental_stats VALUES (?, ?)",
+                                [(film_id, film_id % 3) for film_id in range(1, 31)])
+
+  def cursor(self, **kwargs):
+    return SqliteCursor(self.connection)
+
+  def close(self, error=None):
+    pass
+
+
+@pytest.fixture
+def search_client(monkeypatch):
+  load_catalog(monkeypatch, FILMS, FILM_CATEGORIES)
+  names = NameIndex("actor", "actor_id", {"name": "name"})
+  names.loaded = True
+  for actor_id, name in ACTORS.items():
+    names.add(actor_id, {"name": name})
+  monkeypatch.setattr(server, "actor_names", names)
+  monkeypatch.setattr(names, "needs_refresh", lambda: False)
+  session = SqliteSession()
+  monkeypatch.setattr(server, "get_db", lambda: server.g.setdefault("db", session))
+  server.response_cache.clear()
+  yield server.app.test_client()
+  server.response_cache.clear()
+
+
+def test_cursor_round_trips():
+  assert server.decode_cursor(server.encode_cursor(7), int) == [7]
+  assert server.decode_cursor(server.encode_cursor(2.5, 7), (int, float), int) == [2.5, 7]
+  assert server.decode_cursor(server.encode_cursor("SMITH", 7), str, int) == ["SMITH", 7]
+  assert server.decode_cursor(server.encode_cursor(1, -3, 7), int, int, int) == [1, -3, 7]
+  assert server.decode_cursor("", int) is None
+  assert server.decode_cursor(None, int) is None
+
+
+@pytest.mark.parametrize("cursor", [
+  "not base64!",
+  base64.urlsafe_b64encode(b"not json").decode(),
+  base64.urlsafe_b64encode(json.dumps({"id": 7}).encode()).decode(),
+  server.encode_cursor(7, 8),
+  server.encode_cursor("7"),
+  server.encode_cursor(True),
+])
+def test_decode_cursor_rejects_foreign_cursors(cursor):
+  with pytest.raises(ValueError):
+    server.decode_cursor(cursor, int)
+
+
+def pages(client, url):
+  # Bounded, so a cursor that never advances fails instead of hanging
+  films, cursor = [], None
+  for page in range(len(FILMS)):
+    response = client.get(url + (f"&cursor={cursor}" if cursor else ""))
+    assert response.status_code == 200
+    assert len(response.json) <= 3
+    films += [film["film_id"] for film in response.json]
+    cursor = response.headers.get("X-Next-Cursor")
+    if cursor is None:
+      return films
+  pytest.fail("cursor never reached the last page")
+
+
+@pytest.mark.parametrize("query", [
+  "type=film&mode=substring&query=dino",
+  "type=film&mode=fulltext&query=dinosaur academy",
+  "type=film&mode=fuzzy&query=dinosaur",
+  "type=actor&query=dinosaur",
+  "type=genre&query=horr",
+  "type=all&query=horror",
+  "type=all&mode=fulltext&query=dinosaur",
+])
+def test_search_pages_cover_every_match_once(search_client, query):
+  everything = [film["film_id"] for film in search_client.get(f"/search?{query}&limit=100").json]
+  assert len(everything) > 6
+  paged = pages(search_client, f"/search?{query}&limit=3")
+  assert len(paged) == len(set(paged))
+  assert paged == everything
+
+
+def test_search_rejects_cursor_of_another_mode(search_client):
+  cursor = search_client.get("/search?type=film&mode=substring&query=dino&limit=3").headers["X-Next-Cursor"]
+  response = search_client.get(f"/search?type=film&mode=fuzzy&query=dino&limit=3&cursor={cursor}")
+  assert response.status_code == 400
@@ -0,0 +1,77 @@
+import json
+import threading
+
+import pytest
+
+import server
+from conftest import StubCursor
+
+
+def test_streamed_json_sends_exactly_limit_rows(client):
+  response = client.get("/customers?limit=10&stream=json")
+  assert len(response.json) == 10
+
+
+def test_streamed_ndjson_sends_exactly_limit_rows(client):
+  response = client.get("/customers?limit=10&stream=ndjson")
+  assert len([json.loads(line) for line in response.data.splitlines()]) == 10
+
+
+def test_paged_response_still_has_next_cursor(client):
+  response = client.get("/customers?limit=10")
+  assert len(response.json) == 10
+  assert response.headers["X-Next-Cursor"]
+
+
+def test_streamed_query_has_its_own_budget():
+  with server.app.test_request_context("/customers?stream=json"):
+    assert server.get_db().max_execution_time == server.stream_query_budget
+  with server.app.test_request_context("/customers"):
+    assert server.get_db().max_execution_time == server.query_budgets["get_customers"]
+
+
+def test_failed_ndjson_stream_ends_with_error(client, monkeypatch):
+  def fail(*args):
+    raise server.mysql.connector.Error(errno=server.mysql.connector.errorcode.ER_QUERY_TIMEOUT)
+  monkeypatch.setattr(StubCursor, "fetchmany", fail)
+  cancelled = server.query_stats["cancelled"]
+  response = client.get("/customers?stream=ndjson", buffered=False)
+  body = []
+  with pytest.raises(server.mysql.connector.Error):
+    for chunk in response.response:
+      body.append(chunk)
+  assert json.loads(body[-1]) == {"error": "Query exceeded its time budget"}
+  assert server.query_stats["cancelled"] == cancelled + 1
+  response.close()
+
+
+def test_stream_without_limit_is_capped(client, monkeypatch):
+  monkeypatch.setattr(server, "stream_max_rows", 20)
+  response = client.get("/customers?stream=ndjson")
+  assert len(response.data.splitlines()) == 20
+
+
+def test_slow_stream_stops_at_its_budget(client, monkeypatch):
+  monkeypatch.setattr(server, "stream_query_budget", -1)
+  monkeypatch.setattr(server, "stream_chunk_size", 10)
+  response = client.get("/customers?stream=ndjson", buffered=False)
+  body = []
+  with pytest.raises(TimeoutError):
+    for chunk in response.response:
+      body.append(chunk)
+  response.close()
+  assert json.loads(body[-1]) == {"error": "Query exceeded its time budget"}
+
+
+def test_concurrent_streams_are_capped(client, monkeypatch):
+  monkeypatch.setattr(server, "stream_slots", threading.BoundedSemaphore(1))
+  first = client.get("/customers?stream=ndjson", buffered=False)
+  assert client.get("/customers?stream=ndjson").status_code == 503
+  first.close()
+  assert client.get("/customers?stream=ndjson").status_code == 200
+
+
+def test_stream_is_ignored_where_not_supported():
+  with server.app.test_request_context("/top_actors?stream=json"):
+    assert server.stream_format() is None
+    assert server.get_db().max_execution_time == server.default_query_budget
@@ -0,0 +1,32 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import server
+from search_index import Suggestions
+
+
+@pytest.fixture
+def customers(monkeypatch):
+  names = [(1, "MARY SMITH", 5)]
+  executor = ThreadPoolExecutor(max_workers=1)
+  monkeypatch.setattr(server, "suggestions", Suggestions({"customer": lambda db: list(names)}))
+  monkeypatch.setattr(server, "swr_executor", executor)
+  monkeypatch.setattr(server, "get_db", lambda: None)
+  yield names, executor
+  executor.shutdown()
+
+
+def complete(prefix):
+  response = server.app.test_client().get("/search/suggest", query_string={"type": "customer", "q": prefix})
+  return [item["name"] for item in response.json]
+
+
+def test_expired_index_is_served_while_rebuilding(customers):
+  names, executor = customers
+  assert complete("ma") == ["MARY SMITH"]
+  names.append((2, "MARIA MILLER", 4))
+  server.suggestions.expire("customer")
+  assert complete("ma") == ["MARY SMITH"]
+  executor.shutdown(wait=True)
+  assert complete("ma") == ["MARY SMITH", "MARIA MILLER"]